@@ -4,6 +4,7 @@ from .packages import router as packages_router
 from .payments import router as payments_router
 from .generation import router as generation_router
 from .websocket import router as websocket_router
+from .images import router as images_router
 
 __all__ = [
     "auth_router",
@@ -11,5 +12,6 @@ __all__ = [
     "packages_router",
     "payments_router",
     "generation_router",
-    "websocket_router"
+    "websocket_router",
+    "images_router"
 ]
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..database import get_db
 from ..database.crud import get_user_by_telegram_id, get_user_by_username, create_user
@@ -11,6 +11,8 @@ from ..schemas.auth import (
 from ..schemas.user import UserCreate, UserResponse
 from ..utils.telegram import verify_telegram_auth, send_verification_code
 from ..utils.jwt_handler import create_access_token
+from ..config import settings
+from ..services.rate_limit import rate_limiter, client_ip
 from ..utils.verification_codes import (
     generate_verification_code,
     store_verification_code,
@@ -60,14 +62,19 @@ async def login_with_telegram_widget(
 @router.post("/request-code")
 async def request_verification_code(
     request: TelegramCodeRequest,
+    http_request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     """
     Request verification code via Telegram bot
     User must have started the bot and have username set
     """
-    # Find user by username
     username = request.username.lstrip('@').lower()
+
+    # Every call sends a Telegram message: throttle by client and by target
+    await rate_limiter.check("request_code", db, ip=client_ip(http_request), username=username)
+
+    # Find user by username
     user = await get_user_by_username(db, username)
 
     if not user:
@@ -80,7 +87,7 @@ async def request_verification_code(
     code = generate_verification_code()
 
     # Store code
-    store_verification_code(username, code, user.telegram_id)
+    await store_verification_code(db, username, code, user.telegram_id)
 
     # Send code via bot
     success = await send_verification_code(user.telegram_id, code)
@@ -93,7 +100,7 @@ async def request_verification_code(
 
     return {
         "message": "Verification code sent to your Telegram",
-        "expires_in_minutes": 5
+        "expires_in_minutes": settings.VERIFICATION_CODE_EXPIRE_MINUTES
     }
 
 @router.post("/verify-code", response_model=AuthResponse)
@@ -107,7 +114,7 @@ async def verify_telegram_code(
     username = verify_data.username.lstrip('@').lower()
 
     # Verify code
-    telegram_id = verify_code(username, verify_data.code)
+    telegram_id = await verify_code(db, username, verify_data.code)
 
     if not telegram_id:
         raise HTTPException(
@@ -135,7 +142,6 @@ async def verify_telegram_code(
 @router.get("/bot-info")
 async def get_bot_info():
     """Get bot information for frontend"""
-    from ..config import settings
     return {
         "bot_username": settings.BOT_USERNAME,
         "bot_name": settings.BOT_NAME,
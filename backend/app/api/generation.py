@@ -1,43 +1,149 @@
-from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..database import get_db
+from ..database.session import async_session
 from ..database.models import User
 from ..database.crud import (
-    create_processed_image,
+    create_generation_job,
     create_style_preset,
     delete_style_preset,
+    get_generation_state,
     get_user_by_id
 )
 from ..schemas.generation import (
     GenerationCreate,
     GenerationResponse,
+    GenerationJobState,
     StylePresetCreate,
     StylePresetResponse
 )
-from ..middleware.auth import get_current_user
-from ..services.generation_service import generate_images, ConnectionManager
-from typing import Dict
+from ..middleware.auth import get_current_user, get_current_user_id
+from ..utils.jwt_handler import decode_access_token
+from ..services.websocket_hub import hub
+from ..services.openrouter_client import openrouter_client
+from ..services.admission import AdmissionController
+from ..services.rate_limit import rate_limiter, client_ip
+from ..services.event_log import TERMINAL_STATUSES
+from ..services.ws_protocol import receive_message
+from ..services.storage import resolve_image_urls
+from ..utils.uploads import read_limited_form, read_upload_file
+from ..config import settings
+from typing import Dict, Optional
 import base64
-import asyncio
+import json
+import time
 
 router = APIRouter(prefix="/generation", tags=["generation"])
 
-# WebSocket connection manager
-manager = ConnectionManager()
+# WebSocket connections (shared with /api/ws)
+manager = hub
+
+# In-process queue worker, set from the app lifespan when enabled
+worker = None
+
+# Queue limits and live queue positions
+admission = AdmissionController(manager)
+
+def _no_photoshoots_left() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_402_PAYMENT_REQUIRED,
+        detail="No photoshoots remaining. Please purchase a package."
+    )
+
+def _check_can_generate(current_user: User):
+    """Reject generation requests that cannot be served right now"""
+    # Early exit on the cached balance before reading the upload; it may be
+    # stale, the photoshoot itself is reserved atomically at enqueue
+    if current_user.images_remaining <= 0:
+        raise _no_photoshoots_left()
+
+    # Fail fast while OpenRouter is known to be down
+    if openrouter_client.breaker.is_open:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Generation service is temporarily unavailable. Please try again later.",
+            headers={"Retry-After": str(openrouter_client.breaker.retry_after())}
+        )
+
+async def _enqueue_generation(
+    db: AsyncSession,
+    current_user: User,
+    image_data: bytes,
+    style_name: Optional[str],
+    custom_prompt: Optional[str],
+    aspect_ratio: str
+) -> GenerationResponse:
+    """Reserve a photoshoot, create the image record and queue its generation job"""
+    # Enqueue generation; a queue worker (in this or another process) picks it up
+    created = await create_generation_job(
+        db,
+        user_id=current_user.id,
+        style_name=style_name,
+        prompt_used=custom_prompt,
+        image_data=image_data,
+        style_prompt=style_name or custom_prompt,
+        aspect_ratio=aspect_ratio
+    )
+    if created is None:
+        # Balance used up by jobs queued since the early check
+        raise _no_photoshoots_left()
+    processed_image, _ = created
+    if worker is not None:
+        worker.notify()
+
+    response = GenerationResponse.model_validate(processed_image)
+    queued = await admission.queue_position(db, processed_image.id)
+    if queued:
+        response.queue_position, response.eta_seconds = queued
+
+    # First event of the job: seeds the job-state table for SSE/long-poll
+    await manager.send_status(current_user.id, {
+        "status": "queued",
+        "progress": 0,
+        "message": f"В очереди: {response.queue_position}" if queued else "В очереди",
+        "position": response.queue_position,
+        "eta_seconds": response.eta_seconds,
+        "image_id": processed_image.id
+    })
+    return response
+
+async def _job_state(image_id: int, user_id: int) -> dict:
+    """
+    Latest state of a job from the in-memory table
+    Only jobs this process has seen no event for (e.g. after a restart) are
+    looked up in the database, once.
+    """
+    state = manager.events.job_state(image_id, user_id)
+    if state is not None:
+        return state
+
+    async with async_session() as db:
+        row = await get_generation_state(db, image_id, user_id)
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Generation not found")
+    job_status, processed_file_id = row
+    if processed_file_id:
+        job_status = "completed"
+    return {
+        "image_id": image_id,
+        "status": job_status if job_status in ("queued", "completed", "failed") else "generating_images",
+        "progress": 100 if job_status == "completed" else 0,
+        "images": resolve_image_urls(processed_file_id),
+        "seq": 0
+    }
 
 @router.post("/create", response_model=GenerationResponse)
 async def create_generation(
     generation_data: GenerationCreate,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Create image generation"""
-    # Check if user has photoshoots remaining
-    if current_user.images_remaining <= 0:
-        raise HTTPException(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail="No photoshoots remaining. Please purchase a package."
-        )
+    """Create image generation (base64 image in JSON body)"""
+    _check_can_generate(current_user)
+    await rate_limiter.check("generation", db, ip=client_ip(request), user_id=current_user.id)
+    await admission.check(db, current_user.id)
 
     # Decode base64 image
     try:
@@ -48,56 +154,174 @@ async def create_generation(
             detail="Invalid image data"
         )
 
-    # Create database record
-    processed_image = await create_processed_image(
+    return await _enqueue_generation(
         db,
-        user_id=current_user.id,
-        style_name=generation_data.style_name,
-        prompt_used=generation_data.custom_prompt,
-        aspect_ratio=generation_data.aspect_ratio,
-        is_free=False
+        current_user,
+        image_data,
+        generation_data.style_name,
+        generation_data.custom_prompt,
+        generation_data.aspect_ratio
     )
 
-    # Start generation in background
-    asyncio.create_task(
-        generate_images(
-            db,
-            current_user.id,
-            processed_image.id,
-            image_data,
-            generation_data.style_name or generation_data.custom_prompt,
-            generation_data.aspect_ratio,
-            manager
-        )
+@router.post("/upload", response_model=GenerationResponse)
+async def create_generation_upload(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Create image generation from a multipart/form-data upload
+    Fields: image (file), style_name, custom_prompt, aspect_ratio.
+    The file is streamed to a spooled temp file and the request is rejected
+    with 413 as soon as it exceeds MAX_UPLOAD_SIZE_MB.
+    """
+    _check_can_generate(current_user)
+    await rate_limiter.check("generation", db, ip=client_ip(request), user_id=current_user.id)
+    await admission.check(db, current_user.id)
+
+    form = await read_limited_form(request, settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024)
+    try:
+        image_data = await read_upload_file(form, "image")
+    finally:
+        await form.close()
+
+    return await _enqueue_generation(
+        db,
+        current_user,
+        image_data,
+        form.get("style_name") or None,
+        form.get("custom_prompt") or None,
+        form.get("aspect_ratio") or "1:1"
     )
 
-    return GenerationResponse.model_validate(processed_image)
+@router.get("/{image_id}/status", response_model=GenerationJobState)
+async def get_generation_status(
+    image_id: int,
+    wait: int = Query(0, ge=0),
+    since: Optional[int] = None,
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Long-poll the state of a generation job
+    Returns as soon as the job has an event newer than `since` (default: its
+    current state), or after `wait` seconds with the current state.
+    """
+    state = await _job_state(image_id, user_id)
+    since = state["seq"] if since is None else since
+    deadline = time.monotonic() + min(wait, settings.GENERATION_STATUS_MAX_WAIT)
+
+    while state["seq"] <= since and state["status"] not in TERMINAL_STATUSES:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        await manager.events.wait_for_event(image_id, remaining)
+        state = manager.events.job_state(image_id, user_id) or state
+    return state
+
+@router.get("/{image_id}/events")
+async def stream_generation_events(
+    image_id: int,
+    request: Request,
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Server-Sent Events stream of a generation job's events
+    For clients whose proxies break WebSockets. Resumes after the
+    Last-Event-ID header, and ends after the completed/failed event.
+    """
+    state = await _job_state(image_id, user_id)
+    try:
+        last_seq = int(request.headers.get("last-event-id", 0))
+    except ValueError:
+        last_seq = 0
+
+    def format_event(message: dict) -> str:
+        return f"id: {message.get('seq', 0)}\nevent: status\ndata: {json.dumps(message, ensure_ascii=False)}\n\n"
+
+    async def stream():
+        nonlocal last_seq
+        # Start from the job's current state (it carries the images ready so
+        # far) instead of replaying its history, then follow new events
+        if state["seq"] > last_seq or not last_seq:
+            yield format_event(state)
+            last_seq = max(last_seq, state["seq"])
+            if state["status"] in TERMINAL_STATUSES:
+                return
+
+        while not await request.is_disconnected():
+            for message in manager.events.job_events(user_id, image_id, last_seq):
+                yield format_event(message)
+                last_seq = message["seq"]
+                if message.get("status") in TERMINAL_STATUSES:
+                    return
+            if not await manager.events.wait_for_event(image_id, settings.GENERATION_SSE_KEEPALIVE):
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Let nginx pass events through unbuffered
+        }
+    )
 
 @router.websocket("/ws/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: int):
-    """WebSocket for real-time generation updates"""
-    await manager.connect(user_id, websocket)
+async def websocket_endpoint(
+    websocket: WebSocket,
+    user_id: int,
+    last_seq: Optional[int] = None,
+    access_token: Optional[str] = None
+):
+    """
+    WebSocket for real-time generation updates
+    Reconnect with ?last_seq=<seq of the last event seen> to receive the
+    events missed while disconnected. Replay and snapshots expose the user's
+    job history, so they need ?access_token= of that user; without it the
+    socket only receives live events. Offer the photosession.msgpack.v1
+    subprotocol for compact MessagePack frames.
+    """
+    token_data = decode_access_token(access_token) if access_token else None
+    authenticated = token_data is not None and token_data.user_id == user_id
+    connection = await manager.connect(websocket, user_id, last_seq=last_seq if authenticated else None)
     try:
         while True:
-            # Keep connection alive
-            data = await websocket.receive_text()
-            # Echo back for ping/pong
-            await websocket.send_json({"type": "pong"})
+            try:
+                message = await receive_message(websocket)
+            except ValueError:
+                message = {}
+            connection.touch()
+
+            if message.get("type") == "pong":
+                continue  # Answer to a server heartbeat ping
+            elif message.get("type") in ("resume", "snapshot") and not authenticated:
+                connection.send({"type": "error", "message": "Authentication required"})
+            elif message.get("type") == "resume" and isinstance(message.get("last_seq"), int):
+                manager.resume(connection, message["last_seq"])
+            elif message.get("type") == "snapshot":
+                # Latest state of the user's recent jobs (or of one job)
+                jobs = manager.events.user_snapshots(user_id)
+                if message.get("image_id") is not None:
+                    jobs = [job for job in jobs if job.get("image_id") == message["image_id"]]
+                connection.send({"type": "snapshot", "jobs": jobs})
+            else:
+                # Keep connection alive: echo back for ping/pong
+                connection.send({"type": "pong"})
     except WebSocketDisconnect:
-        manager.disconnect(user_id)
+        pass
+    finally:
+        manager.disconnect(connection)
 
 @router.post("/style-presets", response_model=StylePresetResponse)
 async def create_user_style_preset(
     preset_data: StylePresetCreate,
-    current_user: User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_db)
 ):
     """Save style preset"""
-    from ..config import settings
-
     # Check max saved styles
     from ..database.crud import get_user_style_presets
-    user_presets = await get_user_style_presets(db, current_user.id)
+    user_presets = await get_user_style_presets(db, user_id)
     if len(user_presets) >= settings.MAX_SAVED_STYLES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -106,7 +330,7 @@ async def create_user_style_preset(
 
     preset = await create_style_preset(
         db,
-        user_id=current_user.id,
+        user_id=user_id,
         name=preset_data.name,
         style_data=preset_data.style_data
     )
@@ -116,9 +340,9 @@ async def create_user_style_preset(
 @router.delete("/style-presets/{preset_id}")
 async def delete_user_style_preset(
     preset_id: int,
-    current_user: User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_db)
 ):
     """Delete style preset"""
-    await delete_style_preset(db, preset_id, current_user.id)
+    await delete_style_preset(db, preset_id, user_id)
     return {"message": "Style preset deleted"}
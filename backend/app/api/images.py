@@ -0,0 +1,34 @@
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import FileResponse, Response
+from ..config import settings
+from ..services.storage import image_storage, is_storage_key, CONTENT_TYPES
+import os
+
+router = APIRouter(prefix="/images", tags=["images"])
+
+# Keys are content hashes, so a key's bytes never change
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+@router.get("/{key}")
+async def get_image(key: str):
+    """
+    Serve a stored image
+    In production nginx sends the file itself via X-Accel-Redirect;
+    without nginx (development) the file is streamed by the app.
+    """
+    if not is_storage_key(key):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+
+    content_type = CONTENT_TYPES[key.rsplit(".", 1)[-1]]
+    headers = {"Cache-Control": IMMUTABLE_CACHE}
+
+    backend = image_storage.backend
+    if settings.STORAGE_ACCEL_REDIRECT:
+        prefix = settings.STORAGE_ACCEL_PREFIX.rstrip("/")
+        headers["X-Accel-Redirect"] = f"{prefix}/{backend.relative_path(key)}"
+        return Response(media_type=content_type, headers=headers)
+
+    path = backend.object_path(key)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    return FileResponse(path, media_type=content_type, headers=headers)
@@ -1,27 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from yookassa import Configuration, Payment
+from yookassa import Configuration
 from ..database import get_db
 from ..database.models import User
 from ..database.crud import (
     get_package_by_id,
     create_order,
-    get_order_by_invoice_id,
     update_order,
-    add_photoshoots_to_user
+    record_payment_event,
+    get_user_orders
 )
-from ..schemas.payment import PaymentCreate, PaymentResponse, OrderResponse
-from ..middleware.auth import get_current_user
+from ..schemas.payment import PaymentCreate, PaymentResponse, OrderResponse, OrderPage
+from ..middleware.auth import get_current_user, get_current_user_id
 from ..config import settings
-from ..utils.telegram import send_verification_code
-from datetime import datetime
+from ..services.payment_settlement import payment_settler
+from ..services.yookassa_client import yookassa_client
+from ..utils.pagination import decode_cursor, paginate
 import uuid
 
 router = APIRouter(prefix="/payments", tags=["payments"])
 
-# Configure YooKassa
+# Configure the YooKassa SDK (used by YOOKASSA_CLIENT=thread)
 Configuration.account_id = settings.YOOKASSA_SHOP_ID
 Configuration.secret_key = settings.YOOKASSA_SECRET_KEY
+Configuration.api_url = settings.YOOKASSA_API_URL
 
 @router.post("/create", response_model=PaymentResponse)
 async def create_payment(
@@ -46,12 +48,12 @@ async def create_payment(
         amount=float(package.price_rub)
     )
 
-    # Generate unique idempotence key
+    # Generate unique idempotence key (reused by every retry of this payment)
     idempotence_key = str(uuid.uuid4())
 
     # Create payment in YooKassa
     try:
-        payment = Payment.create({
+        payment = await yookassa_client.create_payment({
             "amount": {
                 "value": str(package.price_rub),
                 "currency": "RUB"
@@ -70,10 +72,10 @@ async def create_payment(
         }, idempotence_key)
 
         # Update order with payment ID
-        await update_order(db, order.id, invoice_id=payment.id)
+        await update_order(db, order.id, invoice_id=payment["id"])
 
         return PaymentResponse(
-            payment_url=payment.confirmation.confirmation_url,
+            payment_url=payment["confirmation_url"],
             order_id=order.id
         )
 
@@ -90,79 +92,51 @@ async def payment_webhook(request: Request, db: AsyncSession = Depends(get_db)):
     """
     YooKassa webhook for payment notifications
     https://yookassa.ru/developers/using-api/webhooks
+    The event is stored (once per event and payment) and acknowledged right
+    away; the order and balance are updated by the payment settler.
     """
     try:
         data = await request.json()
-        event = data.get("event")
-        payment_obj = data.get("object")
+    except ValueError:
+        return {"status": "error", "message": "Invalid JSON"}
 
-        if not payment_obj:
-            return {"status": "error", "message": "No payment object"}
-
-        payment_id = payment_obj.get("id")
-        payment_status = payment_obj.get("status")
-
-        # Find order
-        order = await get_order_by_invoice_id(db, payment_id)
-        if not order:
-            return {"status": "error", "message": "Order not found"}
-
-        # Handle payment success
-        if payment_status == "succeeded" and event == "payment.succeeded":
-            # Update order status
-            await update_order(
-                db,
-                order.id,
-                status="paid",
-                paid_at=datetime.utcnow()
-            )
-
-            # Add photoshoots to user balance
-            await add_photoshoots_to_user(
-                db,
-                order.user_id,
-                order.package.photoshoots_count
-            )
-
-            # Send notification to user via Telegram
-            try:
-                from aiogram import Bot
-                bot = Bot(token=settings.BOT_TOKEN)
-                message = (
-                    f"✅ <b>Оплата прошла успешно!</b>\n\n"
-                    f"Пакет: {order.package.name}\n"
-                    f"Начислено: {order.package.photoshoots_count} фотосессий\n"
-                    f"Сумма: {order.amount}₽\n\n"
-                    f"Теперь вы можете генерировать фото как в боте, так и на сайте!"
-                )
-                await bot.send_message(
-                    chat_id=order.user.telegram_id,
-                    text=message,
-                    parse_mode="HTML"
-                )
-            except Exception as e:
-                print(f"Failed to send Telegram notification: {e}")
-
-        elif payment_status in ["canceled", "cancelled"]:
-            await update_order(db, order.id, status="cancelled")
-
-        return {"status": "ok"}
+    event = data.get("event") if isinstance(data, dict) else None
+    payment_obj = data.get("object") if isinstance(data, dict) else None
+    if not isinstance(payment_obj, dict) or not event or not payment_obj.get("id"):
+        # Malformed: redelivery would not help
+        return {"status": "error", "message": "No payment object"}
 
+    try:
+        event_id = await record_payment_event(
+            db,
+            event,
+            payment_obj["id"],
+            payment_obj.get("status"),
+            data
+        )
     except Exception as e:
+        # Not persisted: answer 5xx so YooKassa delivers the notification again
         print(f"Webhook error: {e}")
-        return {"status": "error", "message": str(e)}
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Failed to record payment event"
+        )
+
+    if event_id is not None:
+        payment_settler.notify()
+    return {"status": "ok"}
 
-@router.get("/orders/my", response_model=list[OrderResponse])
+@router.get("/orders/my", response_model=OrderPage)
 async def get_my_orders(
-    current_user: User = Depends(get_current_user),
+    limit: int = Query(50, ge=1, le=100),
+    cursor: str = None,
+    user_id: int = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get current user's orders"""
-    from sqlalchemy import select
-    result = await db.execute(
-        select(Order)
-        .where(Order.user_id == current_user.id)
-        .order_by(Order.created_at.desc())
+    """Get current user's orders, newest first, one page per cursor"""
+    rows = await get_user_orders(db, user_id, limit + 1, decode_cursor(cursor))
+    orders, next_cursor = paginate(rows, limit)
+    return OrderPage(
+        items=[OrderResponse.model_validate(order) for order in orders],
+        next_cursor=next_cursor
     )
-    orders = result.scalars().all()
-    return [OrderResponse.model_validate(order) for order in orders]
@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..database import get_db
 from ..database.models import User
 from ..database.crud import get_user_images, get_user_style_presets
 from ..schemas.user import UserResponse
-from ..schemas.generation import GenerationResponse, StylePresetResponse
-from ..middleware.auth import get_current_user
+from ..schemas.generation import GenerationResponse, GenerationPage, StylePresetResponse
+from ..middleware.auth import get_current_user, get_current_user_id
+from ..utils.pagination import decode_cursor, paginate
+from ..services.image_variants import preload_variants
 from typing import List
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -17,22 +19,27 @@ async def get_current_user_info(
     """Get current user information"""
     return UserResponse.model_validate(current_user)
 
-@router.get("/me/images", response_model=List[GenerationResponse])
+@router.get("/me/images", response_model=GenerationPage)
 async def get_my_images(
-    limit: int = 50,
-    offset: int = 0,
-    current_user: User = Depends(get_current_user),
+    limit: int = Query(50, ge=1, le=100),
+    cursor: str = None,
+    user_id: int = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get current user's generated images"""
-    images = await get_user_images(db, current_user.id, limit, offset)
-    return [GenerationResponse.model_validate(img) for img in images]
+    """Get current user's generated images, newest first, one page per cursor"""
+    rows = await get_user_images(db, user_id, limit + 1, decode_cursor(cursor))
+    images, next_cursor = paginate(rows, limit)
+    await preload_variants(image.processed_file_id for image in images)
+    return GenerationPage(
+        items=[GenerationResponse.model_validate(image) for image in images],
+        next_cursor=next_cursor
+    )
 
 @router.get("/me/style-presets", response_model=List[StylePresetResponse])
 async def get_my_style_presets(
-    current_user: User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_db)
 ):
     """Get current user's saved style presets"""
-    presets = await get_user_style_presets(db, current_user.id)
+    presets = await get_user_style_presets(db, user_id)
     return [StylePresetResponse.model_validate(preset) for preset in presets]
@@ -1,51 +1,13 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import Dict, Set
-import json
+from ..services.websocket_hub import hub, PROGRESS_STATUSES
+from ..services.ws_protocol import negotiate, receive_message, send_message
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Store active WebSocket connections
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, Set[WebSocket]] = {}
-
-    async def connect(self, websocket: WebSocket, user_id: int):
-        await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = set()
-        self.active_connections[user_id].add(websocket)
-        logger.info(f"WebSocket connected for user {user_id}")
-
-    def disconnect(self, websocket: WebSocket, user_id: int):
-        if user_id in self.active_connections:
-            self.active_connections[user_id].discard(websocket)
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
-        logger.info(f"WebSocket disconnected for user {user_id}")
-
-    async def send_personal_message(self, message: dict, user_id: int):
-        if user_id in self.active_connections:
-            disconnected = set()
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    logger.error(f"Error sending message to user {user_id}: {e}")
-                    disconnected.add(connection)
-
-            # Clean up disconnected websockets
-            for connection in disconnected:
-                self.disconnect(connection, user_id)
-
-    async def broadcast(self, message: dict):
-        """Broadcast message to all connected users"""
-        for user_id in list(self.active_connections.keys()):
-            await self.send_personal_message(message, user_id)
-
-
-manager = ConnectionManager()
+# Shared WebSocket hub (also used by /api/generation/ws)
+manager = hub
 
 
 @router.websocket("/ws")
@@ -56,66 +18,66 @@ async def websocket_endpoint(
     """
     WebSocket endpoint for real-time updates
     Connect with: ws://localhost:8000/api/ws?token=<your_jwt_token>
+    Offer the photosession.msgpack.v1 subprotocol for MessagePack frames.
     """
     # Accept connection first
-    await websocket.accept()
+    protocol, subprotocol = negotiate(websocket)
+    await websocket.accept(subprotocol=subprotocol)
 
-    user_id = None  # Initialize to avoid NameError in finally block
+    connection = None  # Initialize to avoid NameError in finally block
 
     try:
         # Authenticate user from token
         if not token:
-            await websocket.send_json({
+            await send_message(websocket, {
                 "type": "error",
                 "message": "Authentication token required"
-            })
+            }, protocol)
             await websocket.close()
             return
 
         # Get user from token
         try:
             from ..utils.jwt_handler import decode_access_token
-            from ..database.crud import get_user_by_id
+            from ..database.crud import get_user_cached
             from ..database.session import async_session
 
             # Decode the token
             token_data = decode_access_token(token)
             if not token_data:
-                await websocket.send_json({
+                await send_message(websocket, {
                     "type": "error",
                     "message": "Invalid authentication token"
-                })
+                }, protocol)
                 await websocket.close()
                 return
 
             # Get user from database
             async with async_session() as db:
-                user = await get_user_by_id(db, token_data.user_id)
+                user = await get_user_cached(db, token_data.user_id)
                 if not user:
-                    await websocket.send_json({
+                    await send_message(websocket, {
                         "type": "error",
                         "message": "User not found"
-                    })
+                    }, protocol)
                     await websocket.close()
                     return
 
                 user_id = user.id
         except Exception as e:
             logger.error(f"Authentication error: {e}")
-            await websocket.send_json({
+            await send_message(websocket, {
                 "type": "error",
                 "message": "Authentication failed"
-            })
+            }, protocol)
             await websocket.close()
             return
 
-        # Register connection
-        if user_id not in manager.active_connections:
-            manager.active_connections[user_id] = set()
-        manager.active_connections[user_id].add(websocket)
+        # Register connection; from here on all sends go through its queue
+        connection = await manager.connect(websocket, user_id, accept=False, protocol=protocol)
 
         # Send welcome message
-        await websocket.send_json({
+        connection.send({
             "type": "connected",
             "message": "WebSocket connection established",
             "user_id": user_id
@@ -124,33 +86,36 @@ async def websocket_endpoint(
         # Listen for messages
         while True:
             try:
-                data = await websocket.receive_text()
-                message = json.loads(data)
+                message = await receive_message(websocket)
+                connection.touch()
 
                 # Handle different message types
-                if message.get("type") == "ping":
-                    await websocket.send_json({
+                if message.get("type") == "pong":
+                    # Answer to a server heartbeat ping
+                    continue
+                elif message.get("type") == "ping":
+                    connection.send({
                         "type": "pong",
                         "timestamp": message.get("timestamp")
                     })
                 elif message.get("type") == "generation_status":
                     # Client requesting generation status update
-                    await websocket.send_json({
+                    connection.send({
                         "type": "generation_status",
                         "status": "processing",
                         "message": "Generation in progress"
                     })
                 else:
                     # Echo unknown messages
-                    await websocket.send_json({
+                    connection.send({
                         "type": "echo",
                         "data": message
                     })
 
-            except json.JSONDecodeError:
-                await websocket.send_json({
+            except ValueError:
+                connection.send({
                     "type": "error",
-                    "message": "Invalid JSON format"
+                    "message": "Invalid message format"
                 })
             except WebSocketDisconnect:
                 break
@@ -161,22 +126,20 @@ async def websocket_endpoint(
         logger.error(f"WebSocket error: {e}")
     finally:
         # Clean up connection
-        if user_id in manager.active_connections:
-            manager.active_connections[user_id].discard(websocket)
-            if not manager.active_connections[user_id]:
-                del manager.active_connections[user_id]
+        if connection is not None:
+            manager.disconnect(connection)
 
 
 async def send_generation_update(user_id: int, status: str, progress: int = 0, message: str = None):
     """
     Send generation status update to user via WebSocket
     """
-    await manager.send_personal_message({
+    manager.publish(user_id, {
         "type": "generation_update",
         "status": status,
         "progress": progress,
         "message": message
-    }, user_id)
+    }, coalesce_key=("generation_update",) if status in PROGRESS_STATUSES else None)
 
 
 async def send_payment_update(user_id: int, status: str, amount: float = None):
@@ -188,3 +151,16 @@ async def send_payment_update(user_id: int, status: str, amount: float = None):
         "status": status,
         "amount": amount
     }, user_id)
+
+
+async def send_announcement(text: str, level: str = "info") -> dict:
+    """
+    Broadcast a maintenance/promo announcement to every open socket
+    Returns enqueue stats of this process (sockets, not queued, enqueue time,
+    writer failures so far); delivery itself happens in each socket's writer.
+    """
+    return await manager.broadcast({
+        "type": "announcement",
+        "level": level,
+        "message": text
+    })
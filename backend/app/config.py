@@ -6,6 +6,15 @@ class Settings(BaseSettings):
     BOT_TOKEN: str
     BOT_USERNAME: str
     BOT_NAME: str = "PhotoSession Bot"  # Bot display name for website
+    TELEGRAM_API_BASE_URL: str = "https://api.telegram.org"  # Point at mock_upstream.py for load tests
+    TELEGRAM_POOL_SIZE: int = 8  # Max open connections to the Bot API
+    TELEGRAM_REQUEST_TIMEOUT: float = 15.0  # Seconds per Bot API call
+    TELEGRAM_GLOBAL_RATE: float = 25.0  # Messages per second across all chats (Telegram allows ~30)
+    TELEGRAM_PER_CHAT_INTERVAL: float = 1.0  # Min seconds between messages to the same chat
+    TELEGRAM_SEND_QUEUE_SIZE: int = 10000  # Outbound messages buffered before new ones are dropped
+    TELEGRAM_SEND_WORKERS: int = 4  # Concurrent senders draining the queue
+    TELEGRAM_SEND_RETRIES: int = 3  # Retries on network errors and 5xx (429 always waits retry_after)
+    TELEGRAM_SEND_WAIT: float = 5.0  # Seconds login-code requests wait for delivery before answering
     ADMIN_IDS: str
 
     # Database (shared with bot)
@@ -26,11 +35,39 @@ class Settings(BaseSettings):
     OPENROUTER_API_KEY: str
     PROMPT_MODEL: str = "anthropic/claude-3.5-sonnet"
     IMAGE_MODEL: str = "google/gemini-2.0-flash-001"
+    OPENROUTER_BASE_URL: str = "https://openrouter.ai/api/v1"
+    OPENROUTER_POOL_SIZE: int = 32  # Max open connections to OpenRouter
+    OPENROUTER_KEEPALIVE_TIMEOUT: int = 60  # Seconds an idle connection is kept
+    OPENROUTER_ANALYZE_TIMEOUT: float = 60.0
+    OPENROUTER_PROMPT_TIMEOUT: float = 60.0
+    OPENROUTER_IMAGE_TIMEOUT: float = 120.0
+    OPENROUTER_RETRIES: int = 2  # Extra attempts on 429/5xx/network errors
+    OPENROUTER_RETRY_BACKOFF: float = 0.5  # Seconds, jittered and doubled per attempt
+    OPENROUTER_RETRY_AFTER_MAX: float = 30.0  # Cap for upstream Retry-After
+    OPENROUTER_BREAKER_THRESHOLD: int = 5  # Failed calls before the circuit opens
+    OPENROUTER_BREAKER_RESET_SECONDS: int = 30  # Open time before a probe call
 
     # YooKassa
     YOOKASSA_SHOP_ID: str
     YOOKASSA_SECRET_KEY: str
     YOOKASSA_RETURN_URL: str = "https://yourdomain.com/payment/success"
+    YOOKASSA_API_URL: str = "https://api.yookassa.ru/v3"
+    YOOKASSA_CLIENT: str = "async"  # async (pooled aiohttp) | thread (SDK in a bounded thread pool)
+    YOOKASSA_POOL_SIZE: int = 8  # Max open connections to YooKassa
+    YOOKASSA_TIMEOUT: float = 15.0  # Seconds per API call
+    YOOKASSA_RETRIES: int = 2  # Extra attempts on 429/5xx/network errors (same Idempotence-Key)
+    YOOKASSA_THREAD_POOL_SIZE: int = 4  # Threads for YOOKASSA_CLIENT=thread
+    PAYMENT_SETTLE_INTERVAL: float = 5.0  # Seconds between sweeps for unsettled webhook events
+    PAYMENT_SETTLE_BATCH: int = 50  # Events settled per sweep
+    PAYMENT_SETTLE_MAX_ATTEMPTS: int = 20  # Sweeps an event waits for its order before it is dropped
+
+    # Outbox (side effects of committed changes: telegram, websocket, metrika, referral)
+    OUTBOX_BATCH_SIZE: int = 100  # Messages claimed per batch
+    OUTBOX_POLL_INTERVAL: float = 5.0  # Seconds between polls when idle
+    OUTBOX_LEASE_SECONDS: int = 60  # Claimed messages are retried after this if not finished
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    OUTBOX_RETRY_BACKOFF: float = 2.0  # Seconds, jittered and doubled per attempt
+    OUTBOX_CONCURRENCY: str = "telegram:8,websocket:32,metrika:4,referral:2"  # Deliveries in flight per channel
 
     # Website Settings
     SITE_URL: str = "http://localhost:3000"
@@ -42,6 +79,8 @@ class Settings(BaseSettings):
     # Telegram Auth
     TELEGRAM_BOT_ID: str  # Bot ID for widget verification
     VERIFICATION_CODE_EXPIRE_MINUTES: int = 5
+    VERIFICATION_CODE_MAX_ATTEMPTS: int = 5  # Wrong guesses before a code is discarded
+    VERIFICATION_CODE_STORE: str = "memory"  # memory (single process) or postgres (verification_codes table)
 
     # Packages
     PACKAGE_1_NAME: str = "Стартовый"
@@ -64,6 +103,58 @@ class Settings(BaseSettings):
     FREE_PHOTOSHOOTS_COUNT: int = 2
     PHOTOS_PER_PHOTOSHOOT: int = 4
     MAX_SAVED_STYLES: int = 4
+    MAX_UPLOAD_SIZE_MB: int = 15  # Multipart upload limit for /api/generation/upload (nginx client_max_body_size must be larger; setup-nginx.sh derives it)
+
+    # Image generation fan-out
+    IMAGE_GENERATION_PARALLEL: bool = True  # False = one request after another
+    IMAGE_GENERATION_CONCURRENCY: int = 4  # Concurrent upstream calls per photoshoot
+    IMAGE_GENERATION_GLOBAL_CONCURRENCY: int = 16  # Concurrent upstream calls per process
+    IMAGE_GENERATION_RETRIES: int = 2  # Extra attempts per image
+    IMAGE_GENERATION_RETRY_DELAY: float = 1.0  # Seconds, doubled on every retry
+
+    # Upload normalization (before any upstream call)
+    IMAGE_NORMALIZE_ENABLED: bool = True
+    IMAGE_NORMALIZE_MAX_EDGE: int = 1536  # Long edge in pixels
+    IMAGE_NORMALIZE_FORMAT: str = "JPEG"  # JPEG or WEBP
+    IMAGE_NORMALIZE_QUALITY: int = 85
+    IMAGE_NORMALIZE_MAX_BYTES: int = 1500000
+    IMAGE_PROCESSING_EXECUTOR: str = "process"  # process or thread
+    IMAGE_PROCESSING_WORKERS: int = 2
+
+    # Generated image storage (content-addressed, served by nginx)
+    STORAGE_DIR: str = "/app/data/images"
+    STORAGE_ACCEL_REDIRECT: bool = False  # Let nginx send files via X-Accel-Redirect
+    STORAGE_ACCEL_PREFIX: str = "/protected-images"  # nginx internal location
+    STORAGE_DOWNLOAD_POOL_SIZE: int = 16
+    STORAGE_DOWNLOAD_TIMEOUT: float = 60.0
+
+    # Gallery variants (encoded once per stored image after a shoot)
+    IMAGE_VARIANTS_ENABLED: bool = True
+    IMAGE_VARIANT_WIDTHS: str = "320,640,1024"
+    IMAGE_VARIANT_FORMATS: str = "webp,avif"  # avif is skipped if Pillow cannot encode it
+    IMAGE_VARIANT_QUALITY: int = 80
+
+    # Product analysis cache
+    ANALYSIS_CACHE_ENABLED: bool = True
+    ANALYSIS_CACHE_SIZE: int = 1024  # Entries in the in-process LRU tier
+    ANALYSIS_CACHE_PERCEPTUAL: bool = False  # Also match near-duplicate uploads by dHash
+    ANALYSIS_CACHE_PHASH_DISTANCE: int = 4  # Max differing bits for a perceptual hit
+    ANALYSIS_CACHE_DB: bool = False  # Shared Postgres tier (product_analysis_cache table)
+
+    # Generation job queue
+    GENERATION_WORKER_CONCURRENCY: int = 4  # Pipelines run inside the API process (0 = use worker.py only)
+    GENERATION_JOB_MAX_ATTEMPTS: int = 3
+    GENERATION_JOB_RETRY_DELAY: int = 10  # Seconds, doubled on every retry
+    GENERATION_JOB_LEASE_SECONDS: int = 300  # Running jobs not renewed for this long are reclaimed
+    GENERATION_JOB_POLL_INTERVAL: float = 1.0
+
+    # Admission control
+    GENERATION_MAX_RUNNING: int = 8  # Pipelines running at once across all workers
+    GENERATION_MAX_RUNNING_PER_USER: int = 1
+    GENERATION_MAX_ACTIVE_PER_USER: int = 3  # Queued + running per user before 429
+    GENERATION_QUEUE_MAX: int = 100  # Waiting jobs before 503
+    GENERATION_ETA_DEFAULT_SECONDS: int = 60  # Used until real durations are known
+    GENERATION_QUEUE_NOTIFY_INTERVAL: float = 2.0
 
     # Logging
     LOG_LEVEL: str = "INFO"
@@ -80,6 +171,34 @@ class Settings(BaseSettings):
     REFERRAL_REWARD_START: int = 1
     REFERRAL_REWARD_PURCHASE_PERCENT: int = 10
 
+    # Authentication
+    USER_CACHE_TTL: int = 15  # Seconds a cached user row serves authentication (0 disables)
+    USER_CACHE_SIZE: int = 10000
+
+    # Rate limiting (token buckets; rules are "scope:count/seconds", scopes ip, username, user)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory"  # memory (per process) or postgres (shared rate_limit_buckets table)
+    RATE_LIMIT_MAX_KEYS: int = 100000  # Buckets kept by the memory backend
+    RATE_LIMIT_REQUEST_CODE: str = "ip:10/600,username:3/600"
+    RATE_LIMIT_GENERATION: str = "user:20/3600,ip:60/3600"
+
+    # WebSockets
+    WS_SEND_QUEUE_SIZE: int = 64  # Outbound messages buffered per connection
+    WS_PROGRESS_POLICY: str = "coalesce"  # coalesce (keep latest progress) or drop (drop new progress when full)
+    WS_PING_INTERVAL: int = 25  # Seconds of client silence before the server sends a ping
+    WS_IDLE_TIMEOUT: int = 75  # Seconds of silence (no message, no pong) before a socket is closed
+    WS_MAX_CONNECTIONS_PER_USER: int = 5  # Oldest socket is closed when a user opens one more
+    WS_SEND_CONCURRENCY: int = 256  # Sockets written at the same time across the process
+    WS_SEND_TIMEOUT: float = 10.0  # Seconds a single frame may take before the socket is reaped
+    WS_BROADCAST_BATCH: int = 500  # Sockets queued per event-loop turn during a broadcast
+    WS_PUBSUB_BACKEND: str = "memory"  # memory (single process) or postgres (LISTEN/NOTIFY across workers/nodes)
+    WS_PUBSUB_CHANNEL: str = "site_ws_events"
+    WS_PUBSUB_QUEUE_SIZE: int = 10000  # Messages waiting for NOTIFY before new ones are dropped
+    WS_REPLAY_BUFFER_SIZE: int = 32  # Generation events kept per user for reconnects (keep below WS_SEND_QUEUE_SIZE)
+    WS_SNAPSHOT_TTL: int = 900  # Seconds job snapshots and idle replay buffers are kept
+    GENERATION_STATUS_MAX_WAIT: int = 60  # Upper bound for ?wait= on the long-poll status endpoint
+    GENERATION_SSE_KEEPALIVE: int = 15  # Seconds between SSE keep-alive comments
+
     # CORS
     CORS_ORIGINS: str = "http://localhost:3000,http://localhost:5173"
 
@@ -109,6 +228,14 @@ class Settings(BaseSettings):
     def cors_origins_list(self) -> List[str]:
         return [origin.strip() for origin in self.CORS_ORIGINS.split(",") if origin.strip()]
 
+    @property
+    def image_variant_widths(self) -> List[int]:
+        return sorted(int(width.strip()) for width in self.IMAGE_VARIANT_WIDTHS.split(",") if width.strip())
+
+    @property
+    def image_variant_formats(self) -> List[str]:
+        return [fmt.strip().lower() for fmt in self.IMAGE_VARIANT_FORMATS.split(",") if fmt.strip()]
+
     @property
     def packages_config(self) -> List[dict]:
         return [
@@ -9,9 +9,15 @@ from .models import (
     SupportMessage,
     Admin,
     UTMEvent,
-    ReferralReward
+    ReferralReward,
+    GenerationJob,
+    ProductAnalysisCache,
+    VerificationCode,
+    RateLimitBucket,
+    PaymentEvent,
+    OutboxMessage
 )
-from .session import get_db, engine, async_session
+from .session import get_db, engine, async_session, create_site_tables
 
 __all__ = [
     "Base",
@@ -25,7 +31,14 @@ __all__ = [
     "Admin",
     "UTMEvent",
     "ReferralReward",
+    "GenerationJob",
+    "ProductAnalysisCache",
+    "VerificationCode",
+    "RateLimitBucket",
+    "PaymentEvent",
+    "OutboxMessage",
     "get_db",
     "engine",
-    "async_session"
+    "async_session",
+    "create_site_tables"
 ]
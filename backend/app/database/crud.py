@@ -1,8 +1,13 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete, and_
-from typing import Optional, List
-from datetime import datetime
-from .models import User, Package, Order, ProcessedImage, StylePreset
+from sqlalchemy import select, update, delete, and_, or_, func, text, tuple_
+from typing import Dict, Optional, List, Tuple
+from datetime import datetime, timedelta
+from .models import (
+    User, Package, Order, ProcessedImage, StylePreset, GenerationJob,
+    UTMEvent, ReferralReward, VerificationCode, RateLimitBucket, PaymentEvent, OutboxMessage,
+    PurchaseSideEffect
+)
+from .user_cache import user_cache
 from ..schemas.user import UserCreate
 
 # User CRUD
@@ -20,6 +25,15 @@ async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
     )
     return result.scalar_one_or_none()
 
+async def get_user_cached(db: AsyncSession, user_id: int) -> Optional[User]:
+    """Get user by id through the snapshot cache (for authentication)"""
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await get_user_by_id(db, user_id)
+        if user is not None:
+            user_cache.put(user)
+    return user
+
 async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
     """Get user by username"""
     result = await db.execute(
@@ -150,6 +164,34 @@ async def update_order(
     )
     await db.commit()
 
+async def get_user_orders(
+    db: AsyncSession,
+    user_id: int,
+    limit: int = 50,
+    before: Optional[Tuple[datetime, int]] = None
+) -> List[tuple]:
+    """Page of a user's orders with their package name, newest first (keyset on created_at, id)"""
+    query = (
+        select(
+            Order.id,
+            Order.user_id,
+            Order.package_id,
+            Package.name.label("package_name"),
+            Order.amount,
+            Order.status,
+            Order.created_at,
+            Order.paid_at
+        )
+        .join(Package, Package.id == Order.package_id)
+        .where(Order.user_id == user_id)
+        .order_by(Order.created_at.desc(), Order.id.desc())
+        .limit(limit)
+    )
+    if before is not None:
+        query = query.where(tuple_(Order.created_at, Order.id) < tuple_(*before))
+    result = await db.execute(query)
+    return result.all()
+
 async def add_photoshoots_to_user(db: AsyncSession, user_id: int, photoshoots: int):
     """Add photoshoots to user balance"""
     await db.execute(
@@ -158,6 +200,7 @@ async def add_photoshoots_to_user(db: AsyncSession, user_id: int, photoshoots: i
         .values(images_remaining=User.images_remaining + photoshoots)
     )
     await db.commit()
+    user_cache.invalidate(user_id)
 
 # ProcessedImage CRUD
 async def create_processed_image(
@@ -185,17 +228,30 @@ async def get_user_images(
     db: AsyncSession,
     user_id: int,
     limit: int = 50,
-    offset: int = 0
-) -> List[ProcessedImage]:
-    """Get user's processed images"""
-    result = await db.execute(
-        select(ProcessedImage)
+    before: Optional[Tuple[datetime, int]] = None
+) -> List[tuple]:
+    """
+    Page of a user's processed images, newest first (keyset on created_at, id)
+    Selects the gallery columns only (not prompt_used); fetches limit rows.
+    """
+    query = (
+        select(
+            ProcessedImage.id,
+            ProcessedImage.user_id,
+            ProcessedImage.style_name,
+            ProcessedImage.aspect_ratio,
+            ProcessedImage.is_free,
+            ProcessedImage.created_at,
+            ProcessedImage.processed_file_id
+        )
         .where(ProcessedImage.user_id == user_id)
-        .order_by(ProcessedImage.created_at.desc())
+        .order_by(ProcessedImage.created_at.desc(), ProcessedImage.id.desc())
         .limit(limit)
-        .offset(offset)
     )
-    return result.scalars().all()
+    if before is not None:
+        query = query.where(tuple_(ProcessedImage.created_at, ProcessedImage.id) < tuple_(*before))
+    result = await db.execute(query)
+    return result.all()
 
 # StylePreset CRUD
 async def create_style_preset(
@@ -241,3 +297,697 @@ async def delete_style_preset(db: AsyncSession, preset_id: int, user_id: int):
         .values(is_active=False)
     )
     await db.commit()
+
+# GenerationJob CRUD
+
+# pg_advisory_xact_lock key serializing job claims across workers
+GENERATION_CLAIM_LOCK_ID = 7340001
+
+async def create_generation_job(
+    db: AsyncSession,
+    user_id: int,
+    style_name: Optional[str],
+    prompt_used: Optional[str],
+    image_data: bytes,
+    style_prompt: Optional[str],
+    aspect_ratio: str
+) -> Optional[Tuple[ProcessedImage, GenerationJob]]:
+    """
+    Reserve one photoshoot and enqueue its generation job in one transaction
+    Returns None (and creates nothing) if the user has no photoshoots left.
+    The reservation is refunded if the job fails for good.
+    """
+    from ..config import settings
+
+    reserved = await db.execute(
+        update(User)
+        .where(and_(User.id == user_id, User.images_remaining > 0))
+        .values(images_remaining=User.images_remaining - 1)
+        .returning(User.id)
+    )
+    if reserved.scalar_one_or_none() is None:
+        await db.rollback()
+        return None
+
+    image = ProcessedImage(
+        user_id=user_id,
+        style_name=style_name,
+        prompt_used=prompt_used,
+        aspect_ratio=aspect_ratio,
+        is_free=False
+    )
+    db.add(image)
+    await db.flush()
+    job = GenerationJob(
+        user_id=user_id,
+        processed_image_id=image.id,
+        image_data=image_data,
+        style_prompt=style_prompt,
+        aspect_ratio=aspect_ratio,
+        status="queued",
+        max_attempts=settings.GENERATION_JOB_MAX_ATTEMPTS
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(image)
+    await db.refresh(job)
+    user_cache.invalidate(user_id)
+    return image, job
+
+async def _refund_photoshoots(db: AsyncSession, user_ids: List[int]):
+    """Return photoshoots reserved by jobs that failed for good (one per job)"""
+    refunds: Dict[int, int] = {}
+    for user_id in user_ids:
+        refunds[user_id] = refunds.get(user_id, 0) + 1
+    for user_id, count in refunds.items():
+        await db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(images_remaining=User.images_remaining + count)
+        )
+
+async def claim_generation_jobs(db: AsyncSession, worker_id: str, limit: int) -> List[GenerationJob]:
+    """
+    Claim up to `limit` runnable jobs for this worker
+    Picks queued jobs and running jobs whose lease expired (crashed worker).
+    Claims are serialized with an advisory lock so the global and per-user
+    running limits hold across all workers; rows locked by other
+    transactions are skipped instead of waited on.
+    """
+    from ..config import settings
+
+    now = datetime.utcnow()
+    lease_expired = now - timedelta(seconds=settings.GENERATION_JOB_LEASE_SECONDS)
+    await db.execute(select(func.pg_advisory_xact_lock(GENERATION_CLAIM_LOCK_ID)))
+
+    # Live running jobs per user (expired leases are about to be reclaimed)
+    result = await db.execute(
+        select(GenerationJob.user_id, func.count())
+        .where(and_(GenerationJob.status == "running", GenerationJob.locked_at >= lease_expired))
+        .group_by(GenerationJob.user_id)
+    )
+    running_by_user = {user_id: count for user_id, count in result.all()}
+    limit = min(limit, settings.GENERATION_MAX_RUNNING - sum(running_by_user.values()))
+    if limit <= 0:
+        await db.commit()
+        return []
+
+    # Lock candidates by their small columns only; image_data is loaded for claimed jobs
+    result = await db.execute(
+        select(GenerationJob.id, GenerationJob.user_id, GenerationJob.attempts, GenerationJob.max_attempts)
+        .where(or_(
+            and_(GenerationJob.status == "queued", GenerationJob.available_at <= now),
+            and_(GenerationJob.status == "running", GenerationJob.locked_at < lease_expired)
+        ))
+        .order_by(GenerationJob.available_at, GenerationJob.id)
+        .limit(limit * 5)  # Slack for jobs skipped by the per-user limit
+        .with_for_update(skip_locked=True)
+    )
+
+    claimed_ids = []
+    expired = []
+    for row in result.all():
+        if len(claimed_ids) >= limit:
+            break
+        if row.attempts >= row.max_attempts:
+            # Lease expired on the last attempt - give up
+            expired.append(row)
+            continue
+        if running_by_user.get(row.user_id, 0) >= settings.GENERATION_MAX_RUNNING_PER_USER:
+            continue
+        running_by_user[row.user_id] = running_by_user.get(row.user_id, 0) + 1
+        claimed_ids.append(row.id)
+
+    if expired:
+        await db.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id.in_([row.id for row in expired]))
+            .values(
+                status="failed",
+                last_error=func.coalesce(GenerationJob.last_error, "Worker lease expired"),
+                image_data=None,
+                locked_by=None,
+                finished_at=now
+            )
+        )
+        await _refund_photoshoots(db, [row.user_id for row in expired])
+    claimed = []
+    if claimed_ids:
+        await db.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id.in_(claimed_ids))
+            .values(
+                status="running",
+                attempts=GenerationJob.attempts + 1,
+                locked_by=worker_id,
+                locked_at=now,
+                started_at=now
+            )
+        )
+        result = await db.execute(
+            select(GenerationJob)
+            .where(GenerationJob.id.in_(claimed_ids))
+            .order_by(GenerationJob.available_at, GenerationJob.id)
+        )
+        claimed = list(result.scalars().all())
+
+    await db.commit()
+    for row in expired:
+        user_cache.invalidate(row.user_id)
+    return claimed
+
+async def count_active_generation_jobs(db: AsyncSession, user_id: Optional[int] = None) -> int:
+    """Count queued and running jobs (of one user, or of everyone)"""
+    query = select(func.count()).select_from(GenerationJob).where(
+        GenerationJob.status.in_(("queued", "running"))
+    )
+    if user_id is not None:
+        query = query.where(GenerationJob.user_id == user_id)
+    result = await db.execute(query)
+    return result.scalar_one()
+
+async def get_generation_queue(db: AsyncSession, limit: int) -> List[tuple]:
+    """Queued jobs in claim order as (user_id, processed_image_id) rows"""
+    result = await db.execute(
+        select(GenerationJob.user_id, GenerationJob.processed_image_id)
+        .where(GenerationJob.status == "queued")
+        .order_by(GenerationJob.available_at, GenerationJob.id)
+        .limit(limit)
+    )
+    return result.all()
+
+async def get_generation_state(db: AsyncSession, image_id: int, user_id: int) -> Optional[tuple]:
+    """(job status or None, processed_file_id) of a user's generation, None if not theirs"""
+    result = await db.execute(
+        select(GenerationJob.status, ProcessedImage.processed_file_id)
+        .select_from(ProcessedImage)
+        .outerjoin(GenerationJob, GenerationJob.processed_image_id == ProcessedImage.id)
+        .where(and_(ProcessedImage.id == image_id, ProcessedImage.user_id == user_id))
+    )
+    return result.first()
+
+async def get_average_generation_seconds(db: AsyncSession, sample: int = 50) -> Optional[float]:
+    """Average pipeline duration over the most recent completed jobs"""
+    recent = (
+        select((func.extract("epoch", GenerationJob.finished_at - GenerationJob.started_at)).label("seconds"))
+        .where(and_(GenerationJob.status == "completed", GenerationJob.started_at.isnot(None)))
+        .order_by(GenerationJob.finished_at.desc())
+        .limit(sample)
+        .subquery()
+    )
+    result = await db.execute(select(func.avg(recent.c.seconds)))
+    value = result.scalar_one_or_none()
+    return float(value) if value is not None else None
+
+def _owned_job(job: GenerationJob):
+    """Match the job row only while it is still held by this claim"""
+    return and_(
+        GenerationJob.id == job.id,
+        GenerationJob.status == "running",
+        GenerationJob.locked_by == job.locked_by,
+        GenerationJob.attempts == job.attempts
+    )
+
+async def touch_generation_jobs(db: AsyncSession, worker_id: str, job_ids: List[int]):
+    """Extend the lease of jobs still running on this worker"""
+    if not job_ids:
+        return
+    await db.execute(
+        update(GenerationJob)
+        .where(and_(
+            GenerationJob.id.in_(job_ids),
+            GenerationJob.status == "running",
+            GenerationJob.locked_by == worker_id
+        ))
+        .values(locked_at=datetime.utcnow())
+    )
+    await db.commit()
+
+async def complete_generation_job(
+    db: AsyncSession,
+    job: GenerationJob,
+    prompt_used: str,
+    processed_file_id: str,
+    images_processed: int
+) -> bool:
+    """
+    Mark job completed and store results in one transaction
+    The photoshoot was already reserved when the job was enqueued.
+    Returns False if the claim was lost to another worker.
+    """
+    result = await db.execute(
+        update(GenerationJob)
+        .where(_owned_job(job))
+        .values(status="completed", image_data=None, locked_by=None, finished_at=datetime.utcnow())
+        .returning(GenerationJob.id)
+    )
+    if result.scalar_one_or_none() is None:
+        await db.rollback()
+        return False
+
+    await db.execute(
+        update(ProcessedImage)
+        .where(ProcessedImage.id == job.processed_image_id)
+        .values(prompt_used=prompt_used, processed_file_id=processed_file_id)
+    )
+    await db.execute(
+        update(User)
+        .where(User.id == job.user_id)
+        .values(total_images_processed=User.total_images_processed + images_processed)
+    )
+    await db.commit()
+    user_cache.invalidate(job.user_id)
+    return True
+
+async def fail_generation_job(db: AsyncSession, job: GenerationJob, error: str):
+    """
+    Requeue job with a delay, or mark it failed after the last attempt
+    A job that fails for good gets its reserved photoshoot refunded.
+    """
+    from ..config import settings
+
+    now = datetime.utcnow()
+    final = job.attempts >= job.max_attempts
+    if not final:
+        delay = settings.GENERATION_JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+        values = dict(status="queued", available_at=now + timedelta(seconds=delay))
+    else:
+        values = dict(status="failed", image_data=None, finished_at=now)
+
+    result = await db.execute(
+        update(GenerationJob)
+        .where(_owned_job(job))
+        .values(last_error=error[:1000], locked_by=None, **values)
+        .returning(GenerationJob.id)
+    )
+    if final and result.scalar_one_or_none() is not None:
+        await _refund_photoshoots(db, [job.user_id])
+    await db.commit()
+    if final:
+        user_cache.invalidate(job.user_id)
+
+async def release_generation_job(db: AsyncSession, job: GenerationJob):
+    """Return an interrupted job to the queue without counting the attempt"""
+    await db.execute(
+        update(GenerationJob)
+        .where(_owned_job(job))
+        .values(status="queued", attempts=GenerationJob.attempts - 1, locked_by=None)
+    )
+    await db.commit()
+
+# VerificationCode CRUD
+async def upsert_verification_code(
+    db: AsyncSession,
+    username: str,
+    code: str,
+    telegram_id: int,
+    expires_at: datetime
+):
+    """Store a login code, replacing the user's previous one and its attempt count"""
+    from sqlalchemy.dialects.postgresql import insert
+
+    statement = insert(VerificationCode).values(
+        username=username,
+        code=code,
+        telegram_id=telegram_id,
+        attempts=0,
+        expires_at=expires_at,
+        created_at=datetime.utcnow()
+    )
+    await db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[VerificationCode.username],
+            set_=dict(
+                code=statement.excluded.code,
+                telegram_id=statement.excluded.telegram_id,
+                attempts=0,
+                expires_at=statement.excluded.expires_at,
+                created_at=statement.excluded.created_at
+            )
+        )
+    )
+    await db.commit()
+
+async def consume_verification_code(
+    db: AsyncSession,
+    username: str,
+    code: str,
+    max_attempts: int
+) -> Optional[int]:
+    """
+    Delete and return the telegram_id of a matching, unexpired code
+    A wrong guess counts an attempt; the code is gone after max_attempts.
+    """
+    now = datetime.utcnow()
+    result = await db.execute(
+        delete(VerificationCode)
+        .where(and_(
+            VerificationCode.username == username,
+            VerificationCode.code == code,
+            VerificationCode.expires_at > now,
+            VerificationCode.attempts < max_attempts
+        ))
+        .returning(VerificationCode.telegram_id)
+    )
+    telegram_id = result.scalar_one_or_none()
+    if telegram_id is None:
+        attempts = await db.execute(
+            update(VerificationCode)
+            .where(VerificationCode.username == username)
+            .values(attempts=VerificationCode.attempts + 1)
+            .returning(VerificationCode.attempts)
+        )
+        if (attempts.scalar_one_or_none() or 0) >= max_attempts:
+            await db.execute(delete(VerificationCode).where(VerificationCode.username == username))
+    await db.commit()
+    return telegram_id
+
+async def delete_expired_verification_codes(db: AsyncSession) -> int:
+    """Remove expired login codes"""
+    result = await db.execute(
+        delete(VerificationCode).where(VerificationCode.expires_at <= datetime.utcnow())
+    )
+    await db.commit()
+    return result.rowcount
+
+# RateLimitBucket CRUD
+async def take_rate_limit_token(
+    db: AsyncSession,
+    key: str,
+    capacity: float,
+    rate: float,
+    now: float
+) -> Optional[float]:
+    """
+    Refill and take one token from a shared bucket in a single statement
+    Returns None when allowed, otherwise seconds until a token is available.
+    """
+    refilled = "LEAST(:capacity, b.tokens + (:now - b.updated_at) * :rate)"
+    result = await db.execute(
+        text(f"""
+            INSERT INTO rate_limit_buckets AS b (key, tokens, updated_at)
+            VALUES (:key, :capacity - 1, :now)
+            ON CONFLICT (key) DO UPDATE
+                SET tokens = {refilled} - 1, updated_at = :now
+                WHERE {refilled} >= 1
+            RETURNING b.tokens
+        """),
+        {"key": key, "capacity": capacity, "rate": rate, "now": now}
+    )
+    allowed = result.first() is not None
+    await db.commit()
+    if allowed:
+        return None
+
+    result = await db.execute(
+        select(RateLimitBucket.tokens, RateLimitBucket.updated_at).where(RateLimitBucket.key == key)
+    )
+    row = result.first()
+    tokens = min(capacity, row.tokens + (now - row.updated_at) * rate) if row else 0.0
+    return max(0.0, (1 - tokens) / rate)
+
+# PaymentEvent CRUD
+async def record_payment_event(
+    db: AsyncSession,
+    event: str,
+    payment_id: str,
+    payment_status: Optional[str],
+    payload: dict
+) -> Optional[int]:
+    """
+    Store a webhook delivery in one statement
+    Returns the new event id, or None if this event was already received.
+    """
+    from sqlalchemy.dialects.postgresql import insert
+
+    result = await db.execute(
+        insert(PaymentEvent)
+        .values(
+            event_key=f"{event}:{payment_id}",
+            event=event,
+            payment_id=payment_id,
+            payment_status=payment_status,
+            payload=payload,
+            received_at=datetime.utcnow()
+        )
+        .on_conflict_do_nothing(index_elements=[PaymentEvent.event_key])
+        .returning(PaymentEvent.id)
+    )
+    event_id = result.scalar_one_or_none()
+    await db.commit()
+    return event_id
+
+async def get_pending_payment_event_ids(db: AsyncSession, max_attempts: int, limit: int) -> List[int]:
+    """Events not settled yet, oldest first"""
+    result = await db.execute(
+        select(PaymentEvent.id)
+        .where(and_(PaymentEvent.processed_at.is_(None), PaymentEvent.attempts < max_attempts))
+        .order_by(PaymentEvent.id)
+        .limit(limit)
+    )
+    return list(result.scalars().all())
+
+async def record_payment_event_failure(db: AsyncSession, event_id: int, error: str):
+    """Count a failed settlement attempt; the event is skipped after max_attempts"""
+    await db.execute(
+        update(PaymentEvent)
+        .where(PaymentEvent.id == event_id)
+        .values(attempts=PaymentEvent.attempts + 1, last_error=error[:1000])
+    )
+    await db.commit()
+
+async def settle_payment_event(db: AsyncSession, event_id: int, max_attempts: int) -> Optional[int]:
+    """
+    Apply one payment event in a single transaction
+    The order status only moves forward from "pending", so replays and
+    redeliveries never credit the balance twice. A successful payment
+    credits the package and writes its side effects (Telegram message,
+    WebSocket push, Metrika goal, referral reward) to the outbox.
+    Returns the credited user's id, if any.
+    """
+    result = await db.execute(
+        select(PaymentEvent)
+        .where(and_(PaymentEvent.id == event_id, PaymentEvent.processed_at.is_(None)))
+        .with_for_update(skip_locked=True)
+    )
+    event = result.scalar_one_or_none()
+    if event is None:
+        # Settled already, or being settled by another worker
+        await db.rollback()
+        return None
+
+    now = datetime.utcnow()
+    credited_user_id = None
+    order_changed = True  # Events other than success/cancel need no order change
+    if event.event == "payment.succeeded" and event.payment_status == "succeeded":
+        result = await db.execute(
+            update(Order)
+            .where(and_(Order.invoice_id == event.payment_id, Order.status == "pending"))
+            .values(status="paid", paid_at=now)
+            .returning(Order.id, Order.user_id, Order.package_id, Order.amount)
+        )
+        paid = result.first()
+        order_changed = paid is not None
+        if paid is not None:
+            result = await db.execute(
+                select(Package.name, Package.photoshoots_count, User.telegram_id, User.referred_by_id)
+                .select_from(Order)
+                .join(Package, Package.id == Order.package_id)
+                .join(User, User.id == Order.user_id)
+                .where(Order.id == paid.id)
+            )
+            details = result.one()
+            await db.execute(
+                update(User)
+                .where(User.id == paid.user_id)
+                .values(images_remaining=User.images_remaining + details.photoshoots_count)
+            )
+            amount = str(paid.amount)
+            db.add_all([
+                OutboxMessage(channel="telegram", payload={
+                    "chat_id": details.telegram_id,
+                    "template": "payment_succeeded",
+                    "package_name": details.name,
+                    "photoshoots": details.photoshoots_count,
+                    "amount": amount
+                }),
+                OutboxMessage(channel="websocket", payload={
+                    "user_id": paid.user_id,
+                    "status": "succeeded",
+                    "amount": amount
+                }),
+                OutboxMessage(channel="metrika", payload={
+                    "user_id": paid.user_id,
+                    "order_id": paid.id,
+                    "amount": amount
+                }),
+            ])
+            if details.referred_by_id is not None:
+                db.add(OutboxMessage(channel="referral", payload={
+                    "user_id": paid.user_id,
+                    "order_id": paid.id,
+                    "photoshoots": details.photoshoots_count
+                }))
+            credited_user_id = paid.user_id
+    elif event.payment_status in ("canceled", "cancelled"):
+        result = await db.execute(
+            update(Order)
+            .where(and_(Order.invoice_id == event.payment_id, Order.status == "pending"))
+            .values(status="cancelled")
+            .returning(Order.id)
+        )
+        order_changed = result.first() is not None
+
+    if not order_changed:
+        exists = await db.execute(select(Order.id).where(Order.invoice_id == event.payment_id))
+        if exists.first() is None:
+            # The webhook can beat create_payment storing the invoice id: retry later
+            event.attempts += 1
+            event.last_error = "Order not found"
+            if event.attempts < max_attempts:
+                await db.commit()
+                return None
+
+    event.processed_at = now
+    await db.commit()
+    if credited_user_id is not None:
+        user_cache.invalidate(credited_user_id)
+    return credited_user_id
+
+# OutboxMessage CRUD
+async def claim_outbox_messages(db: AsyncSession, limit: int, lease_seconds: int) -> List[tuple]:
+    """
+    Claim due messages as (id, channel, payload, attempts) rows
+    Claimed rows are hidden for `lease_seconds`, so a crashed dispatcher's
+    messages are retried; other dispatchers skip locked rows.
+    """
+    now = datetime.utcnow()
+    due = (
+        select(OutboxMessage.id)
+        .where(and_(OutboxMessage.status == "pending", OutboxMessage.available_at <= now))
+        .order_by(OutboxMessage.available_at, OutboxMessage.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.id.in_(due))
+        .values(attempts=OutboxMessage.attempts + 1, available_at=now + timedelta(seconds=lease_seconds))
+        .returning(OutboxMessage.id, OutboxMessage.channel, OutboxMessage.payload, OutboxMessage.attempts)
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+    await db.commit()
+    return rows
+
+async def mark_outbox_messages_sent(db: AsyncSession, message_ids: List[int]):
+    """Mark delivered messages"""
+    if not message_ids:
+        return
+    await db.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.id.in_(message_ids))
+        .values(status="sent", sent_at=datetime.utcnow(), last_error=None)
+    )
+    await db.commit()
+
+async def fail_outbox_message(db: AsyncSession, message_id: int, error: str, retry_at: Optional[datetime]):
+    """Schedule a retry at `retry_at`, or give up on the message when it is None"""
+    values = dict(available_at=retry_at) if retry_at is not None else dict(status="failed")
+    await db.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.id == message_id)
+        .values(last_error=error[:1000], **values)
+    )
+    await db.commit()
+
+async def _claim_purchase_side_effect(db: AsyncSession, order_id: int, kind: str) -> bool:
+    """
+    Mark a purchase side effect as applied within the caller's transaction
+    Returns False (and rolls back) if an earlier run already applied it.
+    """
+    from sqlalchemy.dialects.postgresql import insert
+
+    result = await db.execute(
+        insert(PurchaseSideEffect)
+        .values(order_id=order_id, kind=kind, created_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=[PurchaseSideEffect.order_id, PurchaseSideEffect.kind])
+        .returning(PurchaseSideEffect.order_id)
+    )
+    if result.scalar_one_or_none() is None:
+        await db.rollback()
+        return False
+    return True
+
+async def record_purchase_event(
+    db: AsyncSession,
+    user_id: int,
+    order_id: int,
+    amount: str,
+    goal: str
+):
+    """Record a Metrika purchase goal for the uploader (once per order)"""
+    from sqlalchemy.dialects.postgresql import insert
+
+    if not await _claim_purchase_side_effect(db, order_id, "metrika"):
+        return
+
+    await db.execute(
+        insert(UTMEvent)
+        .values(
+            user_id=user_id,
+            event_type=goal,
+            metrika_client_id=select(User.metrika_client_id).where(User.id == user_id).scalar_subquery(),
+            event_value=amount,
+            currency="RUB",
+            event_data={"order_id": order_id},
+            sent_to_metrika=False,
+            created_at=datetime.utcnow()
+        )
+    )
+    await db.commit()
+
+async def grant_referral_purchase_reward(
+    db: AsyncSession,
+    user_id: int,
+    order_id: int,
+    photoshoots: int,
+    percent: int
+) -> Optional[tuple]:
+    """
+    Credit the referrer of a paying user (once per order) and queue their notification
+    Returns (referrer_id, photoshoots rewarded), or None if nothing was granted.
+    """
+    result = await db.execute(
+        select(User.id, User.telegram_id)
+        .where(User.id == select(User.referred_by_id).where(User.id == user_id).scalar_subquery())
+    )
+    referrer = result.first()
+    reward = photoshoots * percent // 100
+    if referrer is None or reward <= 0:
+        return None
+
+    if not await _claim_purchase_side_effect(db, order_id, "referral"):
+        return None
+
+    db.add(ReferralReward(
+        user_id=referrer.id,
+        referred_user_id=user_id,
+        order_id=order_id,
+        reward_type="purchase",
+        images_rewarded=reward,
+        created_at=datetime.utcnow()
+    ))
+    await db.execute(
+        update(User)
+        .where(User.id == referrer.id)
+        .values(images_remaining=User.images_remaining + reward)
+    )
+    db.add(OutboxMessage(
+        channel="telegram",
+        payload={"chat_id": referrer.telegram_id, "template": "referral_reward", "photoshoots": reward}
+    ))
+    await db.commit()
+    user_cache.invalidate(referrer.id)
+    return referrer.id, reward
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import BigInteger, Boolean, DateTime, ForeignKey, Integer, Numeric, String, Text, Index, JSON
+from sqlalchemy import BigInteger, Boolean, DateTime, Float, ForeignKey, Integer, LargeBinary, Numeric, String, Text, Index, JSON
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.dialects.postgresql import JSONB
 from typing import Optional, List
@@ -243,4 +243,148 @@ class ReferralReward(Base):
     # Relationships
     user: Mapped["User"] = relationship("User", foreign_keys=[user_id], back_populates="referral_rewards")
     referred_user: Mapped["User"] = relationship("User", foreign_keys=[referred_user_id])
-    order: Mapped[Optional["Order"]] = relationship("Order", foreign_keys=[order_id], back_populates="referral_rewards")
\ No newline at end of file
+    order: Mapped[Optional["Order"]] = relationship("Order", foreign_keys=[order_id], back_populates="referral_rewards")
+
+
+class GenerationJob(Base):
+    """Durable generation queue entry (site-only table, claimed with FOR UPDATE SKIP LOCKED)"""
+    __tablename__ = "generation_jobs"
+    __table_args__ = (
+        Index('idx_generation_jobs_status_available', 'status', 'available_at'),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    processed_image_id: Mapped[int] = mapped_column(Integer, ForeignKey("processed_images.id"), unique=True, nullable=False)
+
+    # Pipeline input; image_data is cleared once the job is finished
+    image_data: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    style_prompt: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    aspect_ratio: Mapped[str] = mapped_column(String(50), nullable=False)
+
+    # queued -> running -> completed | failed (running -> queued on retry)
+    status: Mapped[str] = mapped_column(String(20), default="queued", nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    max_attempts: Mapped[int] = mapped_column(Integer, default=3, nullable=False)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    locked_by: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    locked_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    available_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<GenerationJob(id={self.id}, image_id={self.processed_image_id}, status={self.status}, attempts={self.attempts})>"
+
+
+class ProductAnalysisCache(Base):
+    """Shared cache of vision-model product descriptions (site-only table)"""
+    __tablename__ = "product_analysis_cache"
+
+    content_hash: Mapped[str] = mapped_column(String(64), primary_key=True)  # sha256 of model + image bytes
+    phash: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True, index=True)  # 64-bit dHash
+    model: Mapped[str] = mapped_column(String(255), nullable=False)
+    analysis: Mapped[str] = mapped_column(Text, nullable=False)
+    hits: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ProductAnalysisCache(hash={self.content_hash[:12]}, hits={self.hits})>"
+
+
+class VerificationCode(Base):
+    """Website login codes sent via the bot, shared by all API workers"""
+    __tablename__ = "verification_codes"
+
+    username: Mapped[str] = mapped_column(String(255), primary_key=True)  # lowercased
+    code: Mapped[str] = mapped_column(String(16), nullable=False)
+    telegram_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<VerificationCode(username={self.username}, attempts={self.attempts})>"
+
+
+class RateLimitBucket(Base):
+    """Token buckets shared by all API workers (site-only table)"""
+    __tablename__ = "rate_limit_buckets"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)  # rule:scope:value
+    tokens: Mapped[float] = mapped_column(Float, nullable=False)
+    updated_at: Mapped[float] = mapped_column(Float, nullable=False)  # Unix time of the last refill
+
+    def __repr__(self):
+        return f"<RateLimitBucket(key={self.key}, tokens={self.tokens:.2f})>"
+
+
+class PaymentEvent(Base):
+    """YooKassa webhook deliveries, stored before they are acknowledged (site-only table)"""
+    __tablename__ = "payment_events"
+    __table_args__ = (
+        Index('idx_payment_events_pending', 'processed_at', 'id'),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    event_key: Mapped[str] = mapped_column(String(255), unique=True, nullable=False)  # event:payment_id
+    event: Mapped[str] = mapped_column(String(50), nullable=False)
+    payment_id: Mapped[str] = mapped_column(String(255), nullable=False)
+    payment_status: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+    payload: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    received_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    processed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)  # NULL until settled
+
+    def __repr__(self):
+        return f"<PaymentEvent(id={self.id}, key={self.event_key}, processed={self.processed_at is not None})>"
+
+
+class OutboxMessage(Base):
+    """Side effect to perform after a committed state change (site-only table)"""
+    __tablename__ = "outbox_messages"
+    __table_args__ = (
+        Index('idx_outbox_messages_status_available', 'status', 'available_at'),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    channel: Mapped[str] = mapped_column(String(50), nullable=False)  # e.g. telegram
+    payload: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    # pending -> sent | failed
+    status: Mapped[str] = mapped_column(String(20), default="pending", nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    available_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<OutboxMessage(id={self.id}, channel={self.channel}, status={self.status})>"
+
+
+class PurchaseSideEffect(Base):
+    """Side effect already applied for an order, so outbox re-runs skip it (site-only table)"""
+    __tablename__ = "purchase_side_effects"
+
+    order_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(50), primary_key=True)  # e.g. metrika, referral
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<PurchaseSideEffect(order_id={self.order_id}, kind={self.kind})>"
+
+
+# Tables owned by the site only; the bot's schema does not create them
+# (verification_codes is created here only if the bot has not made it yet)
+SITE_TABLES = [
+    GenerationJob.__table__,
+    ProductAnalysisCache.__table__,
+    VerificationCode.__table__,
+    RateLimitBucket.__table__,
+    PaymentEvent.__table__,
+    OutboxMessage.__table__,
+    PurchaseSideEffect.__table__,
+]
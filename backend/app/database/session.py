@@ -25,3 +25,9 @@ async def get_db():
             yield session
         finally:
             await session.close()
+
+async def create_site_tables():
+    """Create site-only tables that the shared bot schema does not provide"""
+    from .models import Base, SITE_TABLES
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=SITE_TABLES)
@@ -0,0 +1,59 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import inspect
+from ..config import settings
+from .models import User
+
+
+class UserSnapshotCache:
+    """
+    Short-lived, size-bounded cache of user rows for request authentication
+    Stores column values only and hands out a fresh transient User per hit,
+    so no ORM instance is shared between requests. Balance changes made
+    through crud invalidate the entry; changes made elsewhere (the bot, other
+    workers) show up after USER_CACHE_TTL seconds at most.
+    """
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._columns = [attr.key for attr in inspect(User).column_attrs]
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int) -> Optional[User]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return User(**entry[1])
+
+    def put(self, user: User):
+        if self.ttl <= 0:
+            return
+        values = {column: getattr(user, column) for column in self._columns}
+        self._entries[user.id] = (time.monotonic() + self.ttl, values)
+        self._entries.move_to_end(user.id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        if self._entries.pop(user_id, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+            "invalidations": self.invalidations
+        }
+
+
+user_cache = UserSnapshotCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL)
@@ -8,20 +8,69 @@ from .api import (
     packages_router,
     payments_router,
     generation_router,
-    websocket_router
+    websocket_router,
+    images_router
 )
-from .database import engine
+from .database import engine, create_site_tables
 from .database.crud import create_packages_from_config
 from .database.session import async_session
+from .services.openrouter_client import openrouter_client
+from .services.job_queue import GenerationWorker
+from .services.analysis_cache import analysis_cache
+from .services.image_processing import normalization_stats, shutdown_executor
+from .services.storage import image_storage
+from .services.websocket_hub import hub
+from .database.user_cache import user_cache
+from .utils.verification_codes import code_store
+from .services.rate_limit import rate_limiter
+from .services.telegram_dispatcher import telegram_dispatcher
+from .services.yookassa_client import yookassa_client
+from .services.payment_settlement import payment_settler
+from .services.outbox import outbox_dispatcher
+from .api import generation as generation_api
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
-    # Startup: Initialize packages from config
+    # Startup: Create site-only tables and initialize packages from config
+    await create_site_tables()
     async with async_session() as db:
         await create_packages_from_config(db)
+    # Startup: Open the shared OpenRouter connection pool
+    await openrouter_client.start()
+    # Startup: Open the Telegram Bot API pool and send queue
+    await telegram_dispatcher.start()
+    # Startup: Open the YooKassa client used for payment creation
+    await yookassa_client.start()
+    # Startup: Join cross-worker WebSocket fan-out
+    await hub.start()
+    # Startup: Run generation jobs in this process unless a separate worker does
+    if settings.GENERATION_WORKER_CONCURRENCY > 0:
+        generation_api.worker = GenerationWorker(
+            generation_api.manager,
+            settings.GENERATION_WORKER_CONCURRENCY
+        )
+        generation_api.worker.start()
+    generation_api.admission.start()
+    # Startup: Settle stored payment webhook events
+    payment_settler.start()
+    # Startup: Deliver outbox side effects (notifications, analytics, rewards)
+    outbox_dispatcher.start()
     yield
-    # Shutdown: Close database connections
+    # Shutdown: Stop the worker, close upstream and database connections
+    await payment_settler.stop()
+    await outbox_dispatcher.stop()
+    # The worker releases and announces interrupted jobs through the hub, so it stops first
+    if generation_api.worker is not None:
+        await generation_api.worker.stop()
+        generation_api.worker = None
+    await generation_api.admission.stop()
+    await hub.close()
+    await openrouter_client.close()
+    await telegram_dispatcher.close()
+    await yookassa_client.close()
+    await image_storage.close()
+    shutdown_executor()
     await engine.dispose()
 
 app = FastAPI(
@@ -47,6 +96,7 @@ app.include_router(packages_router, prefix="/api")
 app.include_router(payments_router, prefix="/api")
 app.include_router(generation_router, prefix="/api")
 app.include_router(websocket_router, prefix="/api")
+app.include_router(images_router, prefix="/api")
 
 @app.get("/")
 async def root():
@@ -71,3 +121,20 @@ async def api_root():
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
+
+@app.get("/health/stats")
+async def health_stats():
+    """Runtime counters for caches and queues"""
+    return {
+        "analysis_cache": analysis_cache.stats(),
+        "image_normalization": normalization_stats.stats(),
+        "admission": generation_api.admission.stats(),
+        "websockets": hub.stats(),
+        "user_cache": user_cache.stats(),
+        "verification_codes": code_store.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "telegram": telegram_dispatcher.stats(),
+        "payments": yookassa_client.stats(),
+        "payment_settlement": payment_settler.stats(),
+        "outbox": outbox_dispatcher.stats()
+    }
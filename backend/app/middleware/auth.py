@@ -1,18 +1,19 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..database import get_db
-from ..database.crud import get_user_by_id
+from ..database.crud import get_user_cached
 from ..utils.jwt_handler import decode_access_token
 from ..database.models import User
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncSession = Depends(get_db)
 ) -> User:
-    """Get current authenticated user"""
+    """Get current authenticated user (served from the user snapshot cache when fresh)"""
     token = credentials.credentials
 
     token_data = decode_access_token(token)
@@ -23,7 +24,7 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    user = await get_user_by_id(db, token_data.user_id)
+    user = await get_user_cached(db, token_data.user_id)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -32,6 +33,25 @@ async def get_current_user(
 
     return user
 
+async def get_current_user_id(
+    credentials: HTTPAuthorizationCredentials = Depends(optional_security),
+    access_token: str = Query(None)
+) -> int:
+    """
+    User id from the token claims alone, without a database round-trip
+    Use for endpoints that only need to know who the caller is. Also accepts
+    ?access_token= for clients that cannot set headers (EventSource).
+    """
+    token = credentials.credentials if credentials else access_token
+    token_data = decode_access_token(token) if token else None
+    if token_data is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return token_data.user_id
+
 async def get_current_user_optional(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncSession = Depends(get_db)
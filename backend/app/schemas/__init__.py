@@ -10,14 +10,18 @@ from .package import PackageResponse
 from .generation import (
     GenerationCreate,
     GenerationResponse,
+    GenerationPage,
     GenerationStatus,
+    GenerationJobState,
+    ImageVariant,
     StylePresetCreate,
     StylePresetResponse
 )
 from .payment import (
     PaymentCreate,
     PaymentResponse,
-    OrderResponse
+    OrderResponse,
+    OrderPage
 )
 
 __all__ = [
@@ -32,10 +36,14 @@ __all__ = [
     "PackageResponse",
     "GenerationCreate",
     "GenerationResponse",
+    "GenerationPage",
     "GenerationStatus",
+    "GenerationJobState",
+    "ImageVariant",
     "StylePresetCreate",
     "StylePresetResponse",
     "PaymentCreate",
     "PaymentResponse",
-    "OrderResponse"
+    "OrderResponse",
+    "OrderPage"
 ]
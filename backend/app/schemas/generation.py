@@ -1,17 +1,24 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, computed_field
 from typing import Optional, List, Dict
 from datetime import datetime
 from enum import Enum
 
 class GenerationStatus(str, Enum):
     PENDING = "pending"
+    QUEUED = "queued"
     UPLOADING = "uploading"
     ANALYZING = "analyzing"
     GENERATING_PROMPT = "generating_prompt"
     GENERATING_IMAGES = "generating_images"
+    IMAGE_READY = "image_ready"
     COMPLETED = "completed"
     FAILED = "failed"
 
+class ImageVariant(BaseModel):
+    width: int
+    format: str
+    url: str
+
 class GenerationCreate(BaseModel):
     image_base64: str
     style_name: Optional[str] = None
@@ -23,15 +30,52 @@ class GenerationResponse(BaseModel):
     id: int
     user_id: int
     style_name: Optional[str]
-    prompt_used: Optional[str]
+    prompt_used: Optional[str] = None  # Not loaded by gallery listings
     aspect_ratio: Optional[str]
     is_free: bool
     created_at: datetime
     processed_file_id: Optional[str] = None
+    # Set on create while the job waits in the queue
+    queue_position: Optional[int] = None
+    eta_seconds: Optional[int] = None
+
+    @computed_field
+    @property
+    def image_urls(self) -> List[str]:
+        from ..services.storage import resolve_image_urls
+        return resolve_image_urls(self.processed_file_id)
+
+    @computed_field
+    @property
+    def image_variants(self) -> List[List[ImageVariant]]:
+        """Thumbnail/modern-format variants, aligned with image_urls"""
+        from ..services.image_variants import list_variants
+        if not self.processed_file_id:
+            return []
+        return [
+            [ImageVariant(**variant) for variant in list_variants(item.strip())]
+            for item in self.processed_file_id.split(",") if item.strip()
+        ]
 
     class Config:
         from_attributes = True
 
+class GenerationPage(BaseModel):
+    items: List[GenerationResponse]
+    next_cursor: Optional[str] = None  # Pass as ?cursor= for the next page; None on the last one
+
+class GenerationJobState(BaseModel):
+    """Latest state of a generation job, as sent over the WebSocket"""
+    image_id: int
+    status: GenerationStatus
+    progress: int = 0
+    message: Optional[str] = None
+    seq: int = 0
+    image: Optional[str] = None
+    images: List[str] = []
+    position: Optional[int] = None
+    eta_seconds: Optional[int] = None
+
 class StylePresetCreate(BaseModel):
     name: str
     style_data: Dict
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class PaymentCreate(BaseModel):
@@ -14,6 +14,7 @@ class OrderResponse(BaseModel):
     id: int
     user_id: int
     package_id: int
+    package_name: Optional[str] = None
     amount: float
     status: str
     created_at: datetime
@@ -21,3 +22,7 @@ class OrderResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+class OrderPage(BaseModel):
+    items: List[OrderResponse]
+    next_cursor: Optional[str] = None  # Pass as ?cursor= for the next page; None on the last one
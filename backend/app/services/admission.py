@@ -0,0 +1,127 @@
+import asyncio
+import math
+import time
+from typing import Dict, Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..database.crud import (
+    count_active_generation_jobs,
+    get_generation_queue,
+    get_average_generation_seconds
+)
+from ..database.session import async_session
+from .websocket_hub import WebSocketHub
+
+
+class AdmissionController:
+    """
+    Admission control for the generation queue
+    Rejects new jobs when the user already has too many in flight (429) or the
+    global wait queue is full (503), and pushes queue position + ETA to
+    waiting users over the generation WebSocket.
+    """
+    def __init__(self, manager: WebSocketHub):
+        self.manager = manager
+        self._average_seconds: Optional[float] = None
+        self._average_fetched_at = 0.0
+        self._last_sent: Dict[int, Tuple[int, int]] = {}  # image_id -> (position, eta)
+        self._task: Optional[asyncio.Task] = None
+        self.rejected_user_limit = 0
+        self.rejected_queue_full = 0
+
+    async def average_seconds(self, db: AsyncSession) -> float:
+        """Recent average pipeline duration, refreshed at most once a minute"""
+        if time.monotonic() - self._average_fetched_at > 60:
+            try:
+                self._average_seconds = await get_average_generation_seconds(db)
+            except Exception as e:
+                print(f"Failed to load generation duration: {e}")
+            self._average_fetched_at = time.monotonic()
+        return self._average_seconds or settings.GENERATION_ETA_DEFAULT_SECONDS
+
+    def eta_seconds(self, position: int, average: float) -> int:
+        """ETA for the job at 1-based `position` in the wait queue"""
+        rounds = math.ceil(position / max(1, settings.GENERATION_MAX_RUNNING))
+        return int(rounds * average)
+
+    async def check(self, db: AsyncSession, user_id: int):
+        """Raise 429/503 with Retry-After if a new job cannot be admitted"""
+        average = await self.average_seconds(db)
+
+        if await count_active_generation_jobs(db, user_id) >= settings.GENERATION_MAX_ACTIVE_PER_USER:
+            self.rejected_user_limit += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many generations in progress. Please wait for them to finish.",
+                headers={"Retry-After": str(max(1, int(average)))}
+            )
+
+        active = await count_active_generation_jobs(db)
+        if active >= settings.GENERATION_MAX_RUNNING + settings.GENERATION_QUEUE_MAX:
+            self.rejected_queue_full += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Generation queue is full. Please try again later.",
+                headers={"Retry-After": str(max(1, self.eta_seconds(settings.GENERATION_QUEUE_MAX, average)))}
+            )
+
+    async def queue_position(self, db: AsyncSession, image_id: int) -> Optional[Tuple[int, int]]:
+        """(position, eta_seconds) of a queued job, or None if it is not waiting"""
+        queue = await get_generation_queue(db, settings.GENERATION_QUEUE_MAX + settings.GENERATION_MAX_RUNNING)
+        average = await self.average_seconds(db)
+        for position, (_, queued_image_id) in enumerate(queue, start=1):
+            if queued_image_id == image_id:
+                return position, self.eta_seconds(position, average)
+        return None
+
+    async def notify_positions(self):
+        """
+        Push changed queue positions to users with a socket on this process
+        Every API process runs this loop over the same queue, so updates are
+        delivered locally instead of being published to other nodes.
+        """
+        async with async_session() as db:
+            queue = await get_generation_queue(db, settings.GENERATION_QUEUE_MAX + settings.GENERATION_MAX_RUNNING)
+            average = await self.average_seconds(db)
+
+        sent: Dict[int, Tuple[int, int]] = {}
+        for position, (user_id, image_id) in enumerate(queue, start=1):
+            if user_id not in self.manager.active_connections:
+                continue
+            eta = self.eta_seconds(position, average)
+            if self._last_sent.get(image_id) != (position, eta):
+                await self.manager.send_status(user_id, {
+                    "status": "queued",
+                    "progress": 0,
+                    "message": f"В очереди: {position}",
+                    "position": position,
+                    "eta_seconds": eta,
+                    "image_id": image_id
+                }, local=True)
+            sent[image_id] = (position, eta)
+        self._last_sent = sent
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.GENERATION_QUEUE_NOTIFY_INTERVAL)
+            try:
+                await self.notify_positions()
+            except Exception as e:
+                print(f"Queue position update error: {e}")
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "rejected_user_limit": self.rejected_user_limit,
+            "rejected_queue_full": self.rejected_queue_full,
+            "average_seconds": self._average_seconds
+        }
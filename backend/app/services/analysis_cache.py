@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import io
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+from ..config import settings
+from ..database.models import ProductAnalysisCache
+from ..database.session import async_session
+
+
+def content_hash(image_data: bytes) -> str:
+    """Exact cache key: model + upload bytes"""
+    digest = hashlib.sha256(settings.PROMPT_MODEL.encode())
+    digest.update(b"\0")
+    digest.update(image_data)
+    return digest.hexdigest()
+
+
+def perceptual_hash(image_data: bytes) -> Optional[int]:
+    """64-bit difference hash; near-identical re-uploads land within a few bits"""
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(image_data)) as img:
+            img.draft("L", (64, 64))  # Let JPEG decode at reduced size
+            pixels = list(img.convert("L").resize((9, 8)).getdata())
+    except Exception as e:
+        print(f"Perceptual hash error: {e}")
+        return None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    # Store as signed 64-bit so it fits a BIGINT column
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count("1")
+
+
+class AnalysisCache:
+    """
+    Cache for analyze_product results
+    Tier 1 is a size-bounded in-process LRU keyed by content hash (optionally
+    matched by perceptual hash); tier 2 is the product_analysis_cache table
+    shared by all workers. Fallback analyses are never cached.
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max(1, max_size)
+        self._entries: "OrderedDict[str, Tuple[Optional[int], str]]" = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.upstream_seconds = 0.0  # Total time spent on misses
+        self.seconds_saved = 0.0  # Estimated from average miss latency
+
+    def _remember(self, key: str, phash: Optional[int], analysis: str):
+        self._entries[key] = (phash, analysis)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _lookup_memory(self, key: str, phash: Optional[int]) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry[1]
+        if phash is None:
+            return None
+        for other_key, (other_phash, analysis) in self._entries.items():
+            if other_phash is not None and _hamming(phash, other_phash) <= settings.ANALYSIS_CACHE_PHASH_DISTANCE:
+                self._entries.move_to_end(other_key)
+                return analysis
+        return None
+
+    async def _lookup_db(self, key: str, phash: Optional[int]) -> Optional[str]:
+        async with async_session() as db:
+            result = await db.execute(
+                select(ProductAnalysisCache.content_hash, ProductAnalysisCache.analysis)
+                .where(ProductAnalysisCache.content_hash == key)
+            )
+            row = result.first()
+            if row is None and phash is not None:
+                # Exact perceptual match only; the LRU tier handles small distances
+                result = await db.execute(
+                    select(ProductAnalysisCache.content_hash, ProductAnalysisCache.analysis)
+                    .where(ProductAnalysisCache.phash == phash)
+                    .where(ProductAnalysisCache.model == settings.PROMPT_MODEL)
+                    .limit(1)
+                )
+                row = result.first()
+            if row is None:
+                return None
+
+            await db.execute(
+                update(ProductAnalysisCache)
+                .where(ProductAnalysisCache.content_hash == row.content_hash)
+                .values(hits=ProductAnalysisCache.hits + 1)
+            )
+            await db.commit()
+            return row.analysis
+
+    async def _store_db(self, key: str, phash: Optional[int], analysis: str):
+        async with async_session() as db:
+            await db.execute(
+                insert(ProductAnalysisCache)
+                .values(content_hash=key, phash=phash, model=settings.PROMPT_MODEL, analysis=analysis)
+                .on_conflict_do_nothing(index_elements=["content_hash"])
+            )
+            await db.commit()
+
+    def _record_hit(self):
+        if self.misses:
+            self.seconds_saved += self.upstream_seconds / self.misses
+
+    async def get_or_compute(
+        self,
+        image_data: bytes,
+        analyze: Callable[[bytes], Awaitable[str]],
+        fallback: str
+    ) -> str:
+        """Return cached analysis for the image or run `analyze` and cache it"""
+        key = await asyncio.to_thread(content_hash, image_data)
+        phash = None
+        if settings.ANALYSIS_CACHE_PERCEPTUAL:
+            phash = await asyncio.to_thread(perceptual_hash, image_data)
+
+        analysis = self._lookup_memory(key, phash)
+        if analysis is not None:
+            self.memory_hits += 1
+            self._record_hit()
+            return analysis
+
+        if settings.ANALYSIS_CACHE_DB:
+            try:
+                analysis = await self._lookup_db(key, phash)
+            except Exception as e:
+                print(f"Analysis cache lookup error: {e}")
+            if analysis is not None:
+                self.db_hits += 1
+                self._record_hit()
+                self._remember(key, phash, analysis)
+                return analysis
+
+        started = time.monotonic()
+        analysis = await analyze(image_data)
+        if analysis == fallback:
+            return analysis
+
+        self.misses += 1
+        self.upstream_seconds += time.monotonic() - started
+        self._remember(key, phash, analysis)
+        if settings.ANALYSIS_CACHE_DB:
+            try:
+                await self._store_db(key, phash, analysis)
+            except Exception as e:
+                print(f"Analysis cache store error: {e}")
+        return analysis
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.db_hits
+        total = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+            "upstream_calls_saved": hits,
+            "seconds_saved": round(self.seconds_saved, 1)
+        }
+
+
+analysis_cache = AnalysisCache(settings.ANALYSIS_CACHE_SIZE)
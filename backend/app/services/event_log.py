@@ -0,0 +1,176 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from ..config import settings
+
+# Statuses after which a generation job produces no further events
+TERMINAL_STATUSES = {"completed", "failed"}
+
+_last_seq = 0
+
+
+def next_seq() -> int:
+    """
+    Sequence number for a new generation event (a hybrid logical clock)
+    Microseconds since the epoch, but never below the last number issued or
+    seen from another node (observe_seq), so it cannot go backwards when the
+    clock is stepped back and an event published after one from another
+    worker always sorts after it, however far apart the nodes' clocks are.
+    """
+    global _last_seq
+    _last_seq = max(_last_seq + 1, time.time_ns() // 1000)
+    return _last_seq
+
+
+def observe_seq(seq: int):
+    """Move the clock past a sequence number issued by another node"""
+    global _last_seq
+    if seq > _last_seq:
+        _last_seq = seq
+
+
+class UserEvents:
+    def __init__(self, size: int):
+        self.events: Deque[Tuple[int, dict]] = deque(maxlen=size)
+        self.evicted_seq = 0  # Highest seq pushed out of the ring buffer
+        self.touched_at = time.monotonic()
+
+
+class GenerationEventLog:
+    """
+    Recent generation events per user, for resuming a dropped socket
+    Each user keeps a bounded ring buffer of sequenced events; the latest
+    event of every job is kept as its snapshot. Snapshots (of finished jobs
+    in particular) and idle users' buffers expire WS_SNAPSHOT_TTL seconds
+    after their last event.
+    """
+    def __init__(self):
+        self._users: Dict[int, UserEvents] = {}
+        self._snapshots: Dict[int, dict] = {}  # image_id -> latest event
+        self._snapshot_users: Dict[int, int] = {}  # image_id -> user_id
+        self._updated_at: Dict[int, float] = {}  # image_id -> monotonic time
+        self._signals: Dict[int, asyncio.Event] = {}  # image_id -> set on its next event
+        self._waiters: Dict[int, int] = {}  # image_id -> number of waiting requests
+        self._pruned_at = 0.0
+        self.replayed = 0
+        self.snapshots_sent = 0
+
+    def record(self, user_id: int, message: dict):
+        seq = message.get("seq")
+        if seq is None:
+            return
+        observe_seq(seq)
+        self.prune()
+
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = UserEvents(max(1, settings.WS_REPLAY_BUFFER_SIZE))
+        if len(user.events) == user.events.maxlen:
+            user.evicted_seq = user.events[0][0]
+        user.events.append((seq, message))
+        user.touched_at = time.monotonic()
+
+        image_id = message.get("image_id")
+        if image_id is not None:
+            previous = self._snapshots.get(image_id)
+            if previous is None or previous["seq"] <= seq:
+                if message.get("status") == "image_ready" and message.get("image"):
+                    # Keep the images that are ready so far in the snapshot
+                    ready = list((previous or {}).get("images") or [])
+                    message = {**message, "images": ready + [message["image"]]}
+                self._snapshots[image_id] = message
+                self._snapshot_users[image_id] = user_id
+                self._updated_at[image_id] = time.monotonic()
+            signal = self._signals.pop(image_id, None)
+            if signal is not None:
+                signal.set()
+
+    def replay(self, user_id: int, last_seq: int) -> Tuple[List[dict], Optional[List[dict]]]:
+        """
+        Events after `last_seq`, and job snapshots if some of them were
+        already evicted from the buffer (None when the replay is exact)
+        """
+        user = self._users.get(user_id)
+        missed = [message for seq, message in user.events if seq > last_seq] if user else []
+        self.replayed += len(missed)
+        # Buffer expired or overflowed since last_seq: fall back to per-job state
+        if (user is None and last_seq > 0) or (user is not None and user.evicted_seq > last_seq):
+            snapshots = self.user_snapshots(user_id)
+            self.snapshots_sent += len(snapshots)
+            return missed, snapshots
+        return missed, None
+
+    def snapshot(self, image_id: int) -> Optional[dict]:
+        """Latest event of a job, while it runs and for a TTL after it finishes"""
+        self.prune()
+        return self._snapshots.get(image_id)
+
+    def job_state(self, image_id: int, user_id: int) -> Optional[dict]:
+        """Snapshot of a job owned by `user_id`, None if unknown here"""
+        snapshot = self.snapshot(image_id)
+        if snapshot is None or self._snapshot_users.get(image_id) != user_id:
+            return None
+        return snapshot
+
+    def job_events(self, user_id: int, image_id: int, after_seq: int) -> List[dict]:
+        """Buffered events of one job after `after_seq`"""
+        user = self._users.get(user_id)
+        if user is None:
+            return []
+        return [message for seq, message in user.events
+                if seq > after_seq and message.get("image_id") == image_id]
+
+    async def wait_for_event(self, image_id: int, timeout: float) -> bool:
+        """Wait until the job records its next event; False on timeout"""
+        signal = self._signals.get(image_id)
+        if signal is None:
+            signal = self._signals[image_id] = asyncio.Event()
+        self._waiters[image_id] = self._waiters.get(image_id, 0) + 1
+        try:
+            await asyncio.wait_for(signal.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiters[image_id] -= 1
+            if not self._waiters[image_id]:
+                del self._waiters[image_id]
+                if self._signals.get(image_id) is signal:
+                    del self._signals[image_id]
+
+    def user_snapshots(self, user_id: int) -> List[dict]:
+        self.prune()
+        return sorted(
+            (message for image_id, message in self._snapshots.items() if self._snapshot_users[image_id] == user_id),
+            key=lambda message: message["seq"]
+        )
+
+    def prune(self):
+        """Drop expired snapshots and buffers, at most once a second"""
+        now = time.monotonic()
+        if now - self._pruned_at < 1:
+            return
+        self._pruned_at = now
+
+        expired = [image_id for image_id, updated in self._updated_at.items()
+                   if now - updated > settings.WS_SNAPSHOT_TTL]
+        for image_id in expired:
+            del self._updated_at[image_id]
+            self._snapshots.pop(image_id, None)
+            self._snapshot_users.pop(image_id, None)
+
+        idle = [user_id for user_id, user in self._users.items()
+                if now - user.touched_at > settings.WS_SNAPSHOT_TTL]
+        for user_id in idle:
+            del self._users[user_id]
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._users),
+            "events": sum(len(user.events) for user in self._users.values()),
+            "snapshots": len(self._snapshots),
+            "waiters": sum(self._waiters.values()),
+            "replayed": self.replayed,
+            "snapshots_sent": self.snapshots_sent
+        }
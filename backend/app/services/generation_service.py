@@ -1,132 +1,158 @@
-from fastapi import WebSocket
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import update
-from typing import Dict
-from ..database.models import ProcessedImage, User
+from typing import Awaitable, Callable, Dict, Optional
+from ..database.models import GenerationJob
+from ..database.crud import complete_generation_job
 from ..config import settings
-import aiohttp
+from .openrouter_client import openrouter_client, CircuitOpenError
+from .analysis_cache import analysis_cache
+from .image_processing import normalize_image, image_mime_type
+from .storage import image_storage, resolve_image_urls
+from .image_variants import schedule_variants
+from .websocket_hub import WebSocketHub
 import asyncio
 
-class ConnectionManager:
-    """Manage WebSocket connections for real-time updates"""
-    def __init__(self):
-        self.active_connections: Dict[int, WebSocket] = {}
+# Process-wide cap on concurrent /images/generations calls
+image_generation_semaphore = asyncio.Semaphore(max(1, settings.IMAGE_GENERATION_GLOBAL_CONCURRENCY))
 
-    async def connect(self, user_id: int, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
-
-    def disconnect(self, user_id: int):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-
-    async def send_status(self, user_id: int, data: dict):
-        """Send status update to user"""
-        if user_id in self.active_connections:
-            try:
-                await self.active_connections[user_id].send_json(data)
-            except Exception as e:
-                print(f"Error sending status to user {user_id}: {e}")
-                self.disconnect(user_id)
+# Returned by analyze_product when the vision model call fails
+ANALYSIS_FALLBACK = "Product image"
 
 async def generate_images(
     db: AsyncSession,
-    user_id: int,
-    image_id: int,
-    image_data: bytes,
-    style_prompt: str,
-    aspect_ratio: str,
-    manager: ConnectionManager
+    job: GenerationJob,
+    manager: WebSocketHub
 ):
     """
-    Generate images using AI
-    Sends real-time updates via WebSocket
+    Generate images using AI for a claimed generation job
+    Sends real-time updates via WebSocket. Raises on failure so the queue can
+    retry; the photoshoot reserved at enqueue is refunded if the job fails for good.
     """
+    user_id = job.user_id
+    image_id = job.processed_image_id
+    image_data = job.image_data
+    style_prompt = job.style_prompt
+    aspect_ratio = job.aspect_ratio
+
     try:
         # Step 1: Uploading
         await manager.send_status(user_id, {
             "status": "uploading",
             "progress": 10,
-            "message": "Загрузка изображения..."
+            "message": "Загрузка изображения...",
+            "image_id": image_id
         })
 
-        # TODO: Upload image to storage (S3, etc.)
-        await asyncio.sleep(1)  # Simulate upload
+        # Fix orientation, downscale and re-encode before any upstream call
+        original_size = len(image_data)
+        image_data = await normalize_image(image_data)
+        print(f"Generation job {job.id}: normalized upload {original_size} -> {len(image_data)} bytes "
+              f"({original_size - len(image_data)} saved)")
 
         # Step 2: Analyzing
         await manager.send_status(user_id, {
             "status": "analyzing",
             "progress": 30,
-            "message": "Анализ продукта..."
+            "message": "Анализ продукта...",
+            "image_id": image_id
         })
 
         # Analyze product with AI (using Claude via OpenRouter)
-        product_analysis = await analyze_product(image_data)
-        await asyncio.sleep(1)
+        if settings.ANALYSIS_CACHE_ENABLED:
+            product_analysis = await analysis_cache.get_or_compute(
+                image_data, analyze_product, ANALYSIS_FALLBACK
+            )
+        else:
+            product_analysis = await analyze_product(image_data)
 
         # Step 3: Generating prompt
         await manager.send_status(user_id, {
             "status": "generating_prompt",
             "progress": 50,
-            "message": "Создание промпта для AI..."
+            "message": "Создание промпта для AI...",
+            "image_id": image_id
         })
 
         # Generate enhanced prompt
         enhanced_prompt = await generate_prompt(product_analysis, style_prompt)
-        await asyncio.sleep(1)
 
         # Step 4: Generating images
         await manager.send_status(user_id, {
             "status": "generating_images",
             "progress": 70,
-            "message": "Генерация изображений..."
+            "message": "Генерация изображений...",
+            "image_id": image_id
         })
 
-        # Generate images with Gemini
-        generated_images = await generate_with_gemini(
+        # Generate images with Gemini; each result is stored locally and
+        # pushed to the client as soon as it is ready
+        count = settings.PHOTOS_PER_PHOTOSHOOT
+        stored: Dict[int, str] = {}
+
+        async def on_image(index: int, url: str):
+            try:
+                stored[index] = await image_storage.store_from_url(url)
+            except Exception as e:
+                print(f"Failed to store image {index + 1} of job {job.id}: {e}")
+                stored[index] = url  # Keep the upstream URL rather than lose the image
+            await manager.send_status(user_id, {
+                "status": "image_ready",
+                "progress": 70 + 25 * len(stored) // count,
+                "message": f"Готово {len(stored)} из {count}",
+                "image": resolve_image_urls(stored[index])[0],
+                "index": index,
+                "image_id": image_id
+            })
+
+        await generate_with_gemini(
             enhanced_prompt,
             aspect_ratio,
-            count=settings.PHOTOS_PER_PHOTOSHOOT
+            count=count,
+            on_image=on_image
+        )
+        generated_images = [stored[index] for index in sorted(stored)]
+        if not generated_images:
+            raise Exception("No images were generated")
+
+        # Step 5: Save results (the photoshoot was reserved at enqueue)
+        completed = await complete_generation_job(
+            db,
+            job,
+            prompt_used=enhanced_prompt,
+            processed_file_id=",".join(generated_images),  # Store as comma-separated
+            images_processed=settings.PHOTOS_PER_PHOTOSHOOT
         )
+        if not completed:
+            print(f"Generation job {job.id} was already finished by another worker")
+            return
 
-        # Step 5: Complete
         await manager.send_status(user_id, {
             "status": "completed",
             "progress": 100,
             "message": "Готово!",
-            "images": generated_images,
+            "images": resolve_image_urls(",".join(generated_images)),
             "image_id": image_id
         })
 
-        # Update database
-        await db.execute(
-            update(ProcessedImage)
-            .where(ProcessedImage.id == image_id)
-            .values(
-                prompt_used=enhanced_prompt,
-                processed_file_id=",".join(generated_images)  # Store as comma-separated
-            )
-        )
-
-        # Decrease user balance
-        await db.execute(
-            update(User)
-            .where(User.id == user_id)
-            .values(
-                images_remaining=User.images_remaining - 1,
-                total_images_processed=User.total_images_processed + settings.PHOTOS_PER_PHOTOSHOOT
-            )
-        )
-
-        await db.commit()
+        # Thumbnails and WebP/AVIF copies for the gallery
+        schedule_variants(generated_images)
 
     except Exception as e:
-        print(f"Generation error: {e}")
-        await manager.send_status(user_id, {
-            "status": "failed",
-            "progress": 0,
-            "message": f"Ошибка генерации: {str(e)}"
-        })
+        print(f"Generation error (job {job.id}, attempt {job.attempts}/{job.max_attempts}): {e}")
+        if job.attempts >= job.max_attempts:
+            await manager.send_status(user_id, {
+                "status": "failed",
+                "progress": 0,
+                "message": f"Ошибка генерации: {str(e)}",
+                "image_id": image_id
+            })
+        else:
+            await manager.send_status(user_id, {
+                "status": "pending",
+                "progress": 0,
+                "message": "Повторная попытка генерации...",
+                "image_id": image_id
+            })
+        raise
 
 async def analyze_product(image_data: bytes) -> str:
     """Analyze product using Claude via OpenRouter"""
@@ -135,90 +161,124 @@ async def analyze_product(image_data: bytes) -> str:
         import base64
         image_b64 = base64.b64encode(image_data).decode()
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": settings.PROMPT_MODEL,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": "Analyze this product image and describe it in detail for photoshoot generation."
-                                },
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/jpeg;base64,{image_b64}"
-                                    }
+        result = await openrouter_client.post(
+            "/chat/completions",
+            {
+                "model": settings.PROMPT_MODEL,
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": "Analyze this product image and describe it in detail for photoshoot generation."
+                            },
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": f"data:{image_mime_type(image_data)};base64,{image_b64}"
                                 }
-                            ]
-                        }
-                    ]
-                }
-            ) as response:
-                result = await response.json()
-                return result["choices"][0]["message"]["content"]
+                            }
+                        ]
+                    }
+                ]
+            },
+            stage="analyze"
+        )
+        return result["choices"][0]["message"]["content"]
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print(f"Analysis error: {e}")
-        return "Product image"
+        return ANALYSIS_FALLBACK
 
 async def generate_prompt(product_analysis: str, style_prompt: str) -> str:
     """Generate enhanced prompt using Claude"""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": settings.PROMPT_MODEL,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": f"Create a detailed image generation prompt for: {product_analysis}\nStyle: {style_prompt}\nMake it suitable for Gemini image generation."
-                        }
-                    ]
-                }
-            ) as response:
-                result = await response.json()
-                return result["choices"][0]["message"]["content"]
+        result = await openrouter_client.post(
+            "/chat/completions",
+            {
+                "model": settings.PROMPT_MODEL,
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": f"Create a detailed image generation prompt for: {product_analysis}\nStyle: {style_prompt}\nMake it suitable for Gemini image generation."
+                    }
+                ]
+            },
+            stage="prompt"
+        )
+        return result["choices"][0]["message"]["content"]
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print(f"Prompt generation error: {e}")
         return f"{product_analysis} in {style_prompt} style"
 
-async def generate_with_gemini(prompt: str, aspect_ratio: str, count: int = 4) -> list:
-    """Generate images using Gemini via OpenRouter"""
-    try:
-        images = []
-        async with aiohttp.ClientSession() as session:
-            for i in range(count):
-                async with session.post(
-                    "https://openrouter.ai/api/v1/images/generations",
-                    headers={
-                        "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
+async def _generate_single_image(prompt: str, aspect_ratio: str, index: int) -> Optional[str]:
+    """Generate one image, retrying failed or empty responses with backoff"""
+    attempts = max(0, settings.IMAGE_GENERATION_RETRIES) + 1
+    for attempt in range(attempts):
+        try:
+            async with image_generation_semaphore:
+                result = await openrouter_client.post(
+                    "/images/generations",
+                    {
                         "model": settings.IMAGE_MODEL,
                         "prompt": prompt,
                         "aspect_ratio": aspect_ratio,
                         "n": 1
-                    }
-                ) as response:
-                    result = await response.json()
-                    if "data" in result and len(result["data"]) > 0:
-                        images.append(result["data"][0]["url"])
+                    },
+                    stage="image"
+                )
+            if "data" in result and len(result["data"]) > 0:
+                return result["data"][0]["url"]
+            print(f"Image {index + 1}: empty response (attempt {attempt + 1}/{attempts})")
+        except CircuitOpenError as e:
+            print(f"Image {index + 1} skipped: {e}")
+            return None
+        except Exception as e:
+            print(f"Image {index + 1} generation error (attempt {attempt + 1}/{attempts}): {e}")
+
+        if attempt < attempts - 1:
+            await asyncio.sleep(settings.IMAGE_GENERATION_RETRY_DELAY * 2 ** attempt)
+    return None
+
+async def generate_with_gemini(
+    prompt: str,
+    aspect_ratio: str,
+    count: int = 4,
+    on_image: Optional[Callable[[int, str], Awaitable[None]]] = None
+) -> list:
+    """
+    Generate images using Gemini via OpenRouter
+    In parallel mode up to IMAGE_GENERATION_CONCURRENCY calls run at once per
+    photoshoot (and IMAGE_GENERATION_GLOBAL_CONCURRENCY per process).
+    on_image(index, url) is awaited as soon as each image is ready.
+    """
+    async def produce(index: int) -> Optional[str]:
+        url = await _generate_single_image(prompt, aspect_ratio, index)
+        if url and on_image:
+            try:
+                await on_image(index, url)
+            except Exception as e:
+                print(f"Image {index + 1} callback error: {e}")
+        return url
+
+    try:
+        if settings.IMAGE_GENERATION_PARALLEL:
+            shoot_semaphore = asyncio.Semaphore(max(1, settings.IMAGE_GENERATION_CONCURRENCY))
+
+            async def bounded(index: int) -> Optional[str]:
+                async with shoot_semaphore:
+                    return await produce(index)
+
+            results = await asyncio.gather(*(bounded(i) for i in range(count)))
+        else:
+            results = [await produce(i) for i in range(count)]
 
-        return images
+        # Keep request order regardless of completion order
+        return [url for url in results if url]
     except Exception as e:
         print(f"Image generation error: {e}")
         return []
@@ -0,0 +1,149 @@
+import asyncio
+import io
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+from ..config import settings
+
+# Shared pool for Pillow work so decoding/encoding never runs on the event loop
+_executor: Optional[Executor] = None
+
+# EXIF tag holding the camera orientation
+EXIF_ORIENTATION = 0x0112
+
+
+def get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        workers = max(1, settings.IMAGE_PROCESSING_WORKERS)
+        if settings.IMAGE_PROCESSING_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image")
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def run_in_executor(func: Callable, *args):
+    """Run a CPU-bound image function in the shared pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), func, *args)
+
+
+def flatten_to_rgb(img):
+    """
+    RGB (or L) copy of an image with any transparency composited onto white
+    A plain convert("RGB") drops alpha, leaving transparent product cut-outs
+    on black or garbage backgrounds.
+    """
+    from PIL import Image
+
+    if img.mode in ("RGB", "L"):
+        return img
+    if img.mode == "P" and "transparency" in img.info:
+        img = img.convert("RGBA")
+    if img.mode in ("RGBA", "LA", "PA", "RGBa", "La"):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def image_mime_type(image_data: bytes) -> str:
+    """Guess MIME type from magic bytes (defaults to JPEG)"""
+    if image_data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if image_data[:4] == b"RIFF" and image_data[8:12] == b"WEBP":
+        return "image/webp"
+    if image_data[4:12] in (b"ftypavif", b"ftypavis"):
+        return "image/avif"
+    return "image/jpeg"
+
+
+def normalize_image_sync(
+    image_data: bytes,
+    max_edge: int,
+    image_format: str,
+    quality: int,
+    max_bytes: int
+) -> bytes:
+    """
+    Apply EXIF orientation, downscale to `max_edge` and re-encode
+    Quality is lowered step by step until the result fits `max_bytes`.
+    The original is returned when it is already compliant and smaller.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(image_data)) as img:
+        source_format = img.format
+        rotated = img.getexif().get(EXIF_ORIENTATION, 1) != 1
+        oversized = max(img.size) > max_edge
+
+        if not rotated and not oversized and source_format == image_format and len(image_data) <= max_bytes:
+            return image_data
+
+        if source_format == "JPEG" and oversized:
+            img.draft("RGB", (max_edge, max_edge))  # Cheap DCT downscale while decoding
+        normalized = flatten_to_rgb(ImageOps.exif_transpose(img))
+        normalized.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        result = image_data
+        for attempt_quality in range(quality, 49, -10):
+            buffer = io.BytesIO()
+            normalized.save(buffer, format=image_format, quality=attempt_quality, optimize=True)
+            result = buffer.getvalue()
+            if len(result) <= max_bytes:
+                break
+        return result
+
+
+class NormalizationStats:
+    """Running totals for the normalization stage"""
+    def __init__(self):
+        self.jobs = 0
+        self.failures = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def stats(self) -> dict:
+        return {
+            "jobs": self.jobs,
+            "failures": self.failures,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_in - self.bytes_out
+        }
+
+
+normalization_stats = NormalizationStats()
+
+
+async def normalize_image(image_data: bytes) -> bytes:
+    """Normalize an upload before it is sent upstream; falls back to the original on error"""
+    if not settings.IMAGE_NORMALIZE_ENABLED:
+        return image_data
+
+    try:
+        result = await run_in_executor(
+            normalize_image_sync,
+            image_data,
+            settings.IMAGE_NORMALIZE_MAX_EDGE,
+            settings.IMAGE_NORMALIZE_FORMAT.upper(),
+            settings.IMAGE_NORMALIZE_QUALITY,
+            settings.IMAGE_NORMALIZE_MAX_BYTES
+        )
+    except Exception as e:
+        print(f"Image normalization error: {e}")
+        normalization_stats.failures += 1
+        return image_data
+
+    normalization_stats.jobs += 1
+    normalization_stats.bytes_in += len(image_data)
+    normalization_stats.bytes_out += len(result)
+    return result
@@ -0,0 +1,174 @@
+import asyncio
+import io
+import json
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from ..config import settings
+from .image_processing import run_in_executor
+from .storage import image_storage, is_storage_key
+
+# Background variant jobs, kept referenced until they finish
+_pending_tasks: Set[asyncio.Task] = set()
+# Source keys currently being encoded, so concurrent requests share one encode
+_in_flight: Dict[str, asyncio.Future] = {}
+# Source key -> variants it has, as {width, format, key}; filled when variants are
+# encoded or preloaded, so response serialization never touches storage
+_manifests: "OrderedDict[str, List[dict]]" = OrderedDict()
+MANIFEST_CACHE_SIZE = 20000
+
+FORMAT_EXTENSIONS = {"webp": "webp", "avif": "avif", "jpeg": "jpg"}
+
+
+def variant_key(key: str, width: int, image_format: str) -> str:
+    stem = key.rsplit(".", 1)[0]
+    return f"{stem}_w{width}.{FORMAT_EXTENSIONS[image_format]}"
+
+
+def manifest_key(key: str) -> str:
+    stem = key.rsplit(".", 1)[0]
+    return f"{stem}_variants.json"
+
+
+def encode_variants_sync(
+    body: bytes,
+    targets: List[Tuple[int, str]],
+    quality: int
+) -> List[Tuple[int, str, Optional[bytes]]]:
+    """
+    Encode (width, format) variants of one image
+    Widths larger than the source are skipped; formats Pillow cannot
+    write (AVIF without plugin) come back as None.
+    """
+    from PIL import Image
+    try:
+        import pillow_avif  # noqa: F401  AVIF support for Pillow < 11
+    except ImportError:
+        pass
+
+    results = []
+    with Image.open(io.BytesIO(body)) as img:
+        img.load()
+        source = img.convert("RGB") if img.mode not in ("RGB", "RGBA") else img
+        resized: Dict[int, Image.Image] = {}
+        for width, image_format in targets:
+            if width > source.width:
+                continue  # Never upscale: a "640" variant of a 500px image would lie in srcset
+            if width not in resized:
+                height = max(1, round(source.height * width / source.width))
+                resized[width] = source if width == source.width else source.resize((width, height), Image.LANCZOS)
+            buffer = io.BytesIO()
+            try:
+                resized[width].save(buffer, format=image_format.upper(), quality=quality)
+            except (KeyError, OSError, ValueError):
+                results.append((width, image_format, None))
+                continue
+            results.append((width, image_format, buffer.getvalue()))
+    return results
+
+
+def _targets() -> List[Tuple[int, str]]:
+    return [(width, image_format) for width in settings.image_variant_widths for image_format in settings.image_variant_formats]
+
+
+def _remember(key: str, variants: List[dict]):
+    _manifests[key] = variants
+    _manifests.move_to_end(key)
+    while len(_manifests) > MANIFEST_CACHE_SIZE:
+        _manifests.popitem(last=False)
+
+
+async def _load_manifest(key: str) -> Optional[List[dict]]:
+    """Variants recorded for a source image, None if it has not been processed"""
+    backend = image_storage.backend
+    if await backend.head_object(manifest_key(key)) is None:
+        return None
+    return json.loads(await backend.get_object(manifest_key(key)))
+
+
+async def _encode_all(key: str):
+    backend = image_storage.backend
+    if key in _manifests:
+        return
+    manifest = await _load_manifest(key)
+    if manifest is None:
+        body = await backend.get_object(key)
+        encoded = await run_in_executor(encode_variants_sync, body, _targets(), settings.IMAGE_VARIANT_QUALITY)
+        manifest = []
+        for width, image_format, data in encoded:
+            if data is None:
+                continue
+            name = variant_key(key, width, image_format)
+            await backend.put_object(name, data)
+            manifest.append({"width": width, "format": image_format, "key": name})
+        # Written last: its presence means every listed variant exists
+        await backend.put_object(manifest_key(key), json.dumps(manifest).encode(), "application/json")
+    _remember(key, manifest)
+
+
+async def ensure_variants(key: str):
+    """Encode the variants of a stored image exactly once"""
+    if not is_storage_key(key):
+        return
+    existing = _in_flight.get(key)
+    if existing is not None:
+        await existing
+        return
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    try:
+        await _encode_all(key)
+    except Exception as e:
+        print(f"Variant generation error for {key}: {e}")
+    finally:
+        future.set_result(None)
+        del _in_flight[key]
+
+
+async def _generate_all(keys: List[str]):
+    for key in keys:
+        await ensure_variants(key)
+
+
+def schedule_variants(keys: List[str]):
+    """Encode thumbnails/modern formats in the background after a shoot completes"""
+    if not settings.IMAGE_VARIANTS_ENABLED:
+        return
+    task = asyncio.create_task(_generate_all(keys))
+    _pending_tasks.add(task)
+    task.add_done_callback(_pending_tasks.discard)
+
+
+async def preload_variants(processed_file_ids: Iterable[Optional[str]]):
+    """
+    Load variant manifests of a page of images before it is serialized
+    Images without a manifest (stored before manifests existed) are queued
+    for encoding and get their variants on a later request.
+    """
+    missing = []
+    for processed_file_id in processed_file_ids:
+        for key in (processed_file_id or "").split(","):
+            key = key.strip()
+            if not is_storage_key(key) or key in _manifests:
+                continue
+            try:
+                manifest = await _load_manifest(key)
+            except Exception as e:
+                print(f"Failed to load variants of {key}: {e}")
+                continue
+            if manifest is not None:
+                _remember(key, manifest)
+            elif key not in _in_flight:
+                missing.append(key)
+    if missing:
+        schedule_variants(missing)
+
+
+def list_variants(key: str) -> List[dict]:
+    """Known variants of a stored image as {width, format, url} (no storage access)"""
+    if not is_storage_key(key):
+        return []
+    return [
+        {"width": variant["width"], "format": variant["format"], "url": image_storage.public_url(variant["key"])}
+        for variant in _manifests.get(key, ())
+    ]
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import socket
+import uuid
+from typing import Dict, Optional
+from ..config import settings
+from ..database.models import GenerationJob
+from ..database.session import async_session
+from ..database.crud import (
+    claim_generation_jobs,
+    touch_generation_jobs,
+    fail_generation_job,
+    release_generation_job
+)
+from .generation_service import generate_images
+from .websocket_hub import WebSocketHub
+
+
+class GenerationWorker:
+    """
+    Runs up to `concurrency` generation pipelines from the generation_jobs table
+    Any number of workers (in the API process or via worker.py) can share the
+    queue: jobs are claimed with FOR UPDATE SKIP LOCKED and leases are renewed
+    while a pipeline runs, so a crashed worker's jobs are picked up again.
+    """
+    def __init__(self, manager: WebSocketHub, concurrency: int, worker_id: Optional[str] = None):
+        self.manager = manager
+        self.concurrency = max(1, concurrency)
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running: Dict[int, asyncio.Task] = {}
+        self._jobs: Dict[int, GenerationJob] = {}
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._loop_task: Optional[asyncio.Task] = None
+        self._lease_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._loop_task = asyncio.create_task(self.run())
+        self._lease_task = asyncio.create_task(self._renew_leases())
+
+    def notify(self):
+        """Wake the poll loop right away (a job was just enqueued)"""
+        self._wakeup.set()
+
+    async def run(self):
+        print(f"Generation worker {self.worker_id} started (concurrency={self.concurrency})")
+        while not self._stopping:
+            free = self.concurrency - len(self._running)
+            if free > 0:
+                try:
+                    async with async_session() as db:
+                        jobs = await claim_generation_jobs(db, self.worker_id, free)
+                except Exception as e:
+                    print(f"Failed to claim generation jobs: {e}")
+                    jobs = []
+
+                for job in jobs:
+                    self._jobs[job.id] = job
+                    self._running[job.id] = asyncio.create_task(self._process(job))
+                if jobs and len(jobs) == free:
+                    continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.GENERATION_JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _process(self, job: GenerationJob):
+        try:
+            async with async_session() as db:
+                await generate_images(db, job, self.manager)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            try:
+                async with async_session() as db:
+                    await fail_generation_job(db, job, str(e))
+            except Exception as db_error:
+                print(f"Failed to record failure of generation job {job.id}: {db_error}")
+        finally:
+            self._running.pop(job.id, None)
+            self._jobs.pop(job.id, None)
+            self._wakeup.set()
+
+    async def _renew_leases(self):
+        interval = max(1, settings.GENERATION_JOB_LEASE_SECONDS // 3)
+        while not self._stopping:
+            await asyncio.sleep(interval)
+            try:
+                async with async_session() as db:
+                    await touch_generation_jobs(db, self.worker_id, list(self._running))
+            except Exception as e:
+                print(f"Failed to renew generation job leases: {e}")
+
+    async def stop(self):
+        """Stop claiming jobs and hand unfinished ones back to the queue"""
+        self._stopping = True
+        self._wakeup.set()
+        for task in (self._loop_task, self._lease_task):
+            if task:
+                task.cancel()
+
+        interrupted = list(self._jobs.values())
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        for job in interrupted:
+            try:
+                async with async_session() as db:
+                    await release_generation_job(db, job)
+                # Tell the client its job went back to the queue (the hub is still open)
+                await self.manager.send_status(job.user_id, {
+                    "status": "queued",
+                    "progress": 0,
+                    "message": "В очереди",
+                    "image_id": job.processed_image_id
+                })
+            except Exception as e:
+                print(f"Failed to release generation job {job.id}: {e}")
+        print(f"Generation worker {self.worker_id} stopped")
@@ -0,0 +1,182 @@
+import asyncio
+import random
+import time
+from typing import Dict, Optional
+import aiohttp
+from ..config import settings
+
+
+class UpstreamError(Exception):
+    """Non-successful HTTP response from OpenRouter"""
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"OpenRouter returned {status}: {message[:200]}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker rejects a call without contacting OpenRouter"""
+    def __init__(self, retry_after: int):
+        super().__init__(f"OpenRouter circuit is open, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+    closed -> open after `failure_threshold` failed calls,
+    open -> half_open after `reset_timeout` seconds (a single probe call is let through),
+    half_open -> closed on success, back to open on failure
+    """
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == "open"
+
+    def retry_after(self) -> int:
+        if self.opened_at is None:
+            return 0
+        remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+        return max(1, int(remaining + 0.999))
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """Call ended without an outcome (cancelled): let the next request probe instead"""
+        self._probe_in_flight = False
+
+
+class OpenRouterClient:
+    """
+    Long-lived OpenRouter client shared by all generation stages
+    One pooled keep-alive session, per-stage timeouts, jittered retries on 429/5xx
+    and a circuit breaker. Started and closed from the app lifespan.
+    """
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.breaker = CircuitBreaker(
+            settings.OPENROUTER_BREAKER_THRESHOLD,
+            settings.OPENROUTER_BREAKER_RESET_SECONDS
+        )
+        self.timeouts: Dict[str, aiohttp.ClientTimeout] = {
+            "analyze": aiohttp.ClientTimeout(total=settings.OPENROUTER_ANALYZE_TIMEOUT),
+            "prompt": aiohttp.ClientTimeout(total=settings.OPENROUTER_PROMPT_TIMEOUT),
+            "image": aiohttp.ClientTimeout(total=settings.OPENROUTER_IMAGE_TIMEOUT),
+        }
+
+    async def start(self):
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=settings.OPENROUTER_POOL_SIZE,
+            keepalive_timeout=settings.OPENROUTER_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers={
+                "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
+                "Content-Type": "application/json"
+            }
+        )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        # Lazily start for callers running outside the app lifespan (scripts, workers)
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, settings.OPENROUTER_RETRY_AFTER_MAX)
+        base = settings.OPENROUTER_RETRY_BACKOFF * 2 ** attempt
+        return random.uniform(0, base)  # Full jitter
+
+    async def post(self, path: str, payload: dict, stage: str) -> dict:
+        """POST `payload` to `path` and return the decoded JSON response"""
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(self.breaker.retry_after())
+
+        session = await self._get_session()
+        url = f"{settings.OPENROUTER_BASE_URL.rstrip('/')}/{path.lstrip('/')}"
+        retries = max(0, settings.OPENROUTER_RETRIES)
+        last_error: Exception = None
+
+        # Outcome is always reported to the breaker, so a half-open probe can never stay in flight
+        healthy: Optional[bool] = None
+        try:
+            for attempt in range(retries + 1):
+                retry_after = None
+                try:
+                    async with session.post(url, json=payload, timeout=self.timeouts[stage]) as response:
+                        if response.status == 429 or response.status >= 500:
+                            header = response.headers.get("Retry-After")
+                            retry_after = float(header) if header and header.isdigit() else None
+                            raise UpstreamError(response.status, await response.text(), retry_after)
+                        if response.status >= 400:
+                            raise UpstreamError(response.status, await response.text())
+                        result = await response.json(content_type=None)
+                    healthy = True
+                    return result
+                except UpstreamError as e:
+                    if e.status < 500 and e.status != 429:
+                        # Client errors are not retried and do not trip the breaker
+                        healthy = True
+                        raise
+                    last_error = e
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    # ValueError: 2xx with a body that is not JSON
+                    last_error = e
+
+                if attempt < retries:
+                    await asyncio.sleep(self._backoff(attempt, retry_after))
+
+            healthy = False
+            raise last_error
+        finally:
+            if healthy is True:
+                self.breaker.record_success()
+            elif healthy is False:
+                self.breaker.record_failure()
+            else:
+                self.breaker.release_probe()
+
+
+openrouter_client = OpenRouterClient()
@@ -0,0 +1,186 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+from ..config import settings
+from ..database.session import async_session
+from ..database.crud import (
+    claim_outbox_messages,
+    mark_outbox_messages_sent,
+    fail_outbox_message,
+    record_purchase_event,
+    grant_referral_purchase_reward
+)
+from .telegram_dispatcher import telegram_dispatcher
+
+
+def parse_concurrency(spec: str) -> Dict[str, int]:
+    """'telegram:8,websocket:32' -> {"telegram": 8, "websocket": 32}"""
+    limits = {}
+    for item in spec.split(","):
+        channel, _, limit = item.strip().partition(":")
+        if channel:
+            limits[channel] = max(1, int(limit or 1))
+    return limits
+
+
+TELEGRAM_TEMPLATES = {
+    "payment_succeeded": lambda payload: (
+        f"✅ <b>Оплата прошла успешно!</b>\n\n"
+        f"Пакет: {payload['package_name']}\n"
+        f"Начислено: {payload['photoshoots']} фотосессий\n"
+        f"Сумма: {payload['amount']}₽\n\n"
+        f"Теперь вы можете генерировать фото как в боте, так и на сайте!"
+    ),
+    "referral_reward": lambda payload: (
+        f"🎁 <b>Бонус за приглашение!</b>\n\n"
+        f"Ваш друг совершил покупку. Начислено: {payload['photoshoots']} фотосессий"
+    ),
+}
+
+
+async def deliver_telegram(payload: dict):
+    text = TELEGRAM_TEMPLATES[payload["template"]](payload)
+    # Wait for the final outcome: the row must stay pending while the message
+    # only sits in the in-memory send queue, or a restart would lose it
+    delivered = await telegram_dispatcher.send_message(payload["chat_id"], text, wait=None)
+    if delivered is not True:
+        raise RuntimeError("Telegram message was not delivered")
+
+
+async def deliver_websocket(payload: dict):
+    from ..api.websocket import send_payment_update
+
+    await send_payment_update(payload["user_id"], payload["status"], float(payload["amount"]))
+
+
+async def deliver_metrika(payload: dict):
+    async with async_session() as db:
+        await record_purchase_event(
+            db,
+            payload["user_id"],
+            payload["order_id"],
+            payload["amount"],
+            settings.METRIKA_GOAL_PURCHASE
+        )
+
+
+async def deliver_referral(payload: dict):
+    async with async_session() as db:
+        granted = await grant_referral_purchase_reward(
+            db,
+            payload["user_id"],
+            payload["order_id"],
+            payload["photoshoots"],
+            settings.REFERRAL_REWARD_PURCHASE_PERCENT
+        )
+    if granted is not None:
+        outbox_dispatcher.notify()  # Referrer's notification was just queued
+
+
+CHANNEL_HANDLERS: Dict[str, Callable[[dict], Awaitable[None]]] = {
+    "telegram": deliver_telegram,
+    "websocket": deliver_websocket,
+    "metrika": deliver_metrika,
+    "referral": deliver_referral,
+}
+
+
+class OutboxDispatcher:
+    """
+    Performs outbox side effects after the transaction that wrote them
+    Messages are claimed in batches under a lease (SKIP LOCKED, so several
+    dispatchers can run), delivered with a concurrency limit per channel and
+    retried with backoff until OUTBOX_MAX_ATTEMPTS. Handlers must tolerate
+    running twice: a lease can expire while a slow delivery is in flight.
+    """
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._limits = parse_concurrency(settings.OUTBOX_CONCURRENCY)
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        self.sent: Dict[str, int] = {}
+        self.retried = 0
+        self.failed = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    def notify(self):
+        """Drain right away (messages were just committed)"""
+        self._wakeup.set()
+
+    def _slot(self, channel: str) -> asyncio.Semaphore:
+        if channel not in self._slots:
+            self._slots[channel] = asyncio.Semaphore(self._limits.get(channel, 1))
+        return self._slots[channel]
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                drained = await self.drain_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Outbox dispatch error: {e}")
+                drained = 0
+            if drained >= settings.OUTBOX_BATCH_SIZE:
+                continue  # More are probably waiting
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain_batch(self) -> int:
+        async with async_session() as db:
+            messages = await claim_outbox_messages(db, settings.OUTBOX_BATCH_SIZE, settings.OUTBOX_LEASE_SECONDS)
+        if not messages:
+            return 0
+
+        results = await asyncio.gather(*(self._deliver(message) for message in messages))
+        sent = [message.id for message, ok in zip(messages, results) if ok]
+        async with async_session() as db:
+            await mark_outbox_messages_sent(db, sent)
+        return len(messages)
+
+    async def _deliver(self, message) -> bool:
+        handler = CHANNEL_HANDLERS.get(message.channel)
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown outbox channel: {message.channel}")
+            async with self._slot(message.channel):
+                await handler(message.payload)
+            self.sent[message.channel] = self.sent.get(message.channel, 0) + 1
+            return True
+        except Exception as e:
+            retry_at = None
+            if handler is not None and message.attempts < settings.OUTBOX_MAX_ATTEMPTS:
+                delay = random.uniform(0, settings.OUTBOX_RETRY_BACKOFF * 2 ** message.attempts)  # Full jitter
+                retry_at = datetime.utcnow() + timedelta(seconds=delay)
+                self.retried += 1
+            else:
+                self.failed += 1
+                print(f"Outbox message {message.id} ({message.channel}) failed: {e}")
+            try:
+                async with async_session() as db:
+                    await fail_outbox_message(db, message.id, str(e), retry_at)
+            except Exception as db_error:
+                print(f"Failed to record outbox failure {message.id}: {db_error}")
+            return False
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed
+        }
+
+
+outbox_dispatcher = OutboxDispatcher()
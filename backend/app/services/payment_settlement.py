@@ -0,0 +1,89 @@
+import asyncio
+from typing import Optional
+from ..config import settings
+from ..database.session import async_session
+from ..database.crud import (
+    get_pending_payment_event_ids,
+    settle_payment_event,
+    record_payment_event_failure
+)
+from .outbox import outbox_dispatcher
+
+
+class PaymentSettler:
+    """
+    Applies stored webhook events outside the webhook request
+    The webhook only records the event and wakes this loop; a periodic sweep
+    also picks up events left over by a crash or an early delivery. Events
+    are locked with SKIP LOCKED, so several API workers can run settlers.
+    """
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.settled = 0
+        self.credited = 0
+        self.errors = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    def notify(self):
+        """Settle right away (an event was just recorded)"""
+        self._wakeup.set()
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.settle_pending()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"Payment settlement error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.PAYMENT_SETTLE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def settle_pending(self):
+        async with async_session() as db:
+            event_ids = await get_pending_payment_event_ids(
+                db,
+                settings.PAYMENT_SETTLE_MAX_ATTEMPTS,
+                settings.PAYMENT_SETTLE_BATCH
+            )
+        for event_id in event_ids:
+            try:
+                async with async_session() as db:
+                    user_id = await settle_payment_event(db, event_id, settings.PAYMENT_SETTLE_MAX_ATTEMPTS)
+            except Exception as e:
+                # Count the attempt so one bad event cannot hold up the ones behind it
+                self.errors += 1
+                print(f"Failed to settle payment event {event_id}: {e}")
+                try:
+                    async with async_session() as db:
+                        await record_payment_event_failure(db, event_id, str(e))
+                except Exception as db_error:
+                    print(f"Failed to record settlement failure of event {event_id}: {db_error}")
+                continue
+            self.settled += 1
+            if user_id is not None:
+                self.credited += 1
+                outbox_dispatcher.notify()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "settled": self.settled,
+            "credited": self.credited,
+            "errors": self.errors
+        }
+
+
+payment_settler = PaymentSettler()
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, List, Optional
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+NOTIFY_PAYLOAD_LIMIT = 7900
+
+Handler = Callable[[dict], None]
+
+
+class PubSubBackend(ABC):
+    """Fan-out of WebSocket messages between processes serving the same site"""
+    def __init__(self):
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handler: Optional[Handler] = None
+        self.published = 0
+        self.received = 0
+
+    async def start(self, handler: Handler):
+        self.handler = handler
+
+    @abstractmethod
+    def publish(self, envelope: dict):
+        """Hand a message to the other nodes; never blocks the caller"""
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "node_id": self.node_id,
+            "published": self.published,
+            "received": self.received
+        }
+
+
+class InProcessPubSub(PubSubBackend):
+    """Single-process deployment: the hub already delivered locally, nothing to forward"""
+    def publish(self, envelope: dict):
+        self.published += 1
+
+
+class PostgresPubSub(PubSubBackend):
+    """
+    LISTEN/NOTIFY on the database shared with the bot
+    One connection listens; another sends queued notifications in batches,
+    one round-trip per batch. Messages from this node are ignored on receipt
+    because the hub delivered them to local sockets already.
+    """
+    def __init__(self, dsn: str, channel: str):
+        super().__init__()
+        self.dsn = dsn
+        self.channel = channel
+        self._outbox: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_PUBSUB_QUEUE_SIZE)
+        self._listen_connection = None
+        self._tasks: List[asyncio.Task] = []
+        self.dropped = 0
+        self.oversized = 0
+        self.reconnects = 0
+
+    async def start(self, handler: Handler):
+        await super().start(handler)
+        self._tasks = [
+            asyncio.create_task(self._run(self._listen)),
+            asyncio.create_task(self._run(self._send))
+        ]
+
+    def publish(self, envelope: dict):
+        payload = json.dumps({**envelope, "node": self.node_id}, ensure_ascii=False, separators=(",", ":"))
+        if len(payload.encode()) > NOTIFY_PAYLOAD_LIMIT:
+            self.oversized += 1
+            logger.warning(f"Pub/sub message for user {envelope.get('user_id')} too large for NOTIFY, delivered locally only")
+            return
+        try:
+            self._outbox.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _connect(self):
+        import asyncpg
+        return await asyncpg.connect(self.dsn.replace("postgresql+asyncpg://", "postgresql://", 1))
+
+    async def _run(self, loop: Callable[[], Awaitable[None]]):
+        """Keep a connection loop alive, reconnecting with backoff"""
+        delay = 1.0
+        while True:
+            try:
+                await loop()
+                delay = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.reconnects += 1
+                logger.error(f"Pub/sub connection error: {e}, reconnecting in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    async def _listen(self):
+        connection = await self._connect()
+        self._listen_connection = connection
+        try:
+            await connection.add_listener(self.channel, self._on_notification)
+            while not connection.is_closed():
+                await asyncio.sleep(5)
+                await connection.execute("SELECT 1")
+        finally:
+            self._listen_connection = None
+            await connection.close()
+
+    def _on_notification(self, connection, pid, channel, payload):
+        try:
+            envelope = json.loads(payload)
+        except ValueError:
+            return
+        if envelope.pop("node", None) == self.node_id:
+            return
+        self.received += 1
+        if self.handler is not None:
+            self.handler(envelope)
+
+    async def _send(self):
+        connection = await self._connect()
+        try:
+            while True:
+                batch = [await self._outbox.get()]
+                while not self._outbox.empty() and len(batch) < 100:
+                    batch.append(self._outbox.get_nowait())
+                await connection.execute(
+                    "SELECT pg_notify($1, payload) FROM unnest($2::text[]) AS payload",
+                    self.channel,
+                    batch
+                )
+                self.published += len(batch)
+        finally:
+            await connection.close()
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "pending": self._outbox.qsize(),
+            "dropped": self.dropped,
+            "oversized": self.oversized,
+            "reconnects": self.reconnects
+        }
+
+
+def create_pubsub() -> PubSubBackend:
+    if settings.WS_PUBSUB_BACKEND == "postgres":
+        return PostgresPubSub(settings.database_url, settings.WS_PUBSUB_CHANNEL)
+    return InProcessPubSub()
@@ -0,0 +1,149 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Union
+from fastapi import HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..database.crud import take_rate_limit_token
+
+# Route name -> setting holding its rules
+ROUTE_SETTINGS = {
+    "request_code": "RATE_LIMIT_REQUEST_CODE",
+    "generation": "RATE_LIMIT_GENERATION",
+}
+
+SCOPES = ("ip", "username", "user")
+
+
+class Rule(NamedTuple):
+    scope: str
+    capacity: float  # Burst size
+    rate: float  # Tokens added per second
+
+
+def parse_rules(spec: str) -> List[Rule]:
+    """'ip:10/600,username:3/600' -> 10 per 600s by IP and 3 per 600s by username"""
+    rules = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        scope, _, limit = item.partition(":")
+        count, _, seconds = limit.partition("/")
+        if scope not in SCOPES:
+            raise ValueError(f"Unknown rate limit scope: {scope}")
+        rules.append(Rule(scope, float(count), float(count) / float(seconds)))
+    return rules
+
+
+def client_ip(request: Request) -> Optional[str]:
+    """Client address as seen by nginx (X-Real-IP), falling back to the socket peer"""
+    return request.headers.get("x-real-ip") or (request.client.host if request.client else None)
+
+
+class MemoryBuckets:
+    """Per-process buckets; least recently used keys are dropped beyond max_keys"""
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()  # key -> [tokens, updated_at]
+
+    async def take(self, db: AsyncSession, key: str, capacity: float, rate: float) -> Optional[float]:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [capacity, now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return None
+        return (1 - bucket[0]) / rate
+
+    def size(self) -> int:
+        return len(self._buckets)
+
+
+class PostgresBuckets:
+    """Buckets in the rate_limit_buckets table, shared by all workers (one round-trip when allowed)"""
+    async def take(self, db: AsyncSession, key: str, capacity: float, rate: float) -> Optional[float]:
+        return await take_rate_limit_token(db, key, capacity, rate, time.time())
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class RateLimiter:
+    """
+    Token-bucket limits per route, keyed by client IP, username and/or user id
+    Rules come from settings (see ROUTE_SETTINGS); a request is rejected with
+    429 and Retry-After if any of its buckets is empty.
+    """
+    def __init__(self, backend: Union[MemoryBuckets, PostgresBuckets]):
+        self.backend = backend
+        self._rules: Dict[str, List[Rule]] = {}
+        self.allowed = 0
+        self.limited = 0
+        self.checks = 0
+        self.total_seconds = 0.0
+
+    def rules(self, route: str) -> List[Rule]:
+        if route not in self._rules:
+            self._rules[route] = parse_rules(getattr(settings, ROUTE_SETTINGS[route]))
+        return self._rules[route]
+
+    async def check(
+        self,
+        route: str,
+        db: AsyncSession,
+        ip: Optional[str] = None,
+        username: Optional[str] = None,
+        user_id: Optional[int] = None
+    ):
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        started = time.perf_counter()
+        values = {"ip": ip, "username": username.lower() if username else None, "user": user_id}
+
+        retry_after = 0.0
+        for rule in self.rules(route):
+            value = values[rule.scope]
+            if value is None:
+                continue
+            wait = await self.backend.take(db, f"{route}:{rule.scope}:{value}", rule.capacity, rule.rate)
+            if wait is not None:
+                retry_after = max(retry_after, wait)
+
+        self.checks += 1
+        self.total_seconds += time.perf_counter() - started
+        if retry_after > 0:
+            self.limited += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests. Please try again later.",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+        self.allowed += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "buckets": self.backend.size(),
+            "average_ms": round(self.total_seconds / self.checks * 1000, 3) if self.checks else None
+        }
+
+
+def create_rate_limiter() -> RateLimiter:
+    if settings.RATE_LIMIT_BACKEND == "postgres":
+        return RateLimiter(PostgresBuckets())
+    return RateLimiter(MemoryBuckets(settings.RATE_LIMIT_MAX_KEYS))
+
+
+rate_limiter = create_rate_limiter()
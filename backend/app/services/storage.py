@@ -0,0 +1,163 @@
+import asyncio
+import base64
+import hashlib
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from typing import List, Optional
+import aiohttp
+from ..config import settings
+from .image_processing import image_mime_type
+
+# Content-addressed keys: 128-bit sha256 prefix + extension (fits 4 per processed_file_id)
+KEY_PATTERN = re.compile(r"^[0-9a-f]{32}(_[0-9a-z]+)?\.(jpg|png|webp|avif)$")
+
+EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/avif": "avif",
+}
+CONTENT_TYPES = {ext: mime for mime, ext in EXTENSIONS.items()}
+
+
+class StorageBackend(ABC):
+    """
+    Minimal S3-style object storage interface
+    Keys are flat strings; implementations decide the physical layout.
+    """
+    @abstractmethod
+    async def put_object(self, key: str, body: bytes, content_type: Optional[str] = None):
+        ...
+
+    @abstractmethod
+    async def get_object(self, key: str) -> bytes:
+        ...
+
+    @abstractmethod
+    async def head_object(self, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def delete_object(self, key: str):
+        ...
+
+
+class LocalStorageBackend(StorageBackend):
+    """Filesystem backend; objects are sharded as ab/cd/<key> under `root`"""
+    def __init__(self, root: str):
+        self.root = root
+
+    def relative_path(self, key: str) -> str:
+        return f"{key[:2]}/{key[2:4]}/{key}"
+
+    def object_path(self, key: str) -> str:
+        return os.path.join(self.root, self.relative_path(key))
+
+    def _write(self, path: str, body: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see partial files
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(body)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _read(self, path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def put_object(self, key: str, body: bytes, content_type: Optional[str] = None):
+        path = self.object_path(key)
+        if os.path.exists(path):
+            return  # Content-addressed: same key, same bytes
+        await asyncio.to_thread(self._write, path, body)
+
+    async def get_object(self, key: str) -> bytes:
+        return await asyncio.to_thread(self._read, self.object_path(key))
+
+    async def head_object(self, key: str) -> Optional[dict]:
+        path = self.object_path(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        ext = key.rsplit(".", 1)[-1]
+        return {"size": stat.st_size, "content_type": CONTENT_TYPES.get(ext, "application/octet-stream")}
+
+    async def delete_object(self, key: str):
+        try:
+            os.unlink(self.object_path(key))
+        except FileNotFoundError:
+            pass
+
+
+class ImageStorage:
+    """Downloads generated images once and stores them under content-addressed keys"""
+    def __init__(self, backend: LocalStorageBackend):
+        self.backend = backend
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=settings.STORAGE_DOWNLOAD_POOL_SIZE),
+                timeout=aiohttp.ClientTimeout(total=settings.STORAGE_DOWNLOAD_TIMEOUT)
+            )
+        return self._session
+
+    @staticmethod
+    def make_key(body: bytes, suffix: str = "") -> str:
+        ext = EXTENSIONS.get(image_mime_type(body), "jpg")
+        return f"{hashlib.sha256(body).hexdigest()[:32]}{suffix}.{ext}"
+
+    async def put_image(self, body: bytes) -> str:
+        key = self.make_key(body)
+        await self.backend.put_object(key, body, CONTENT_TYPES[key.rsplit(".", 1)[-1]])
+        return key
+
+    async def fetch(self, url: str) -> bytes:
+        """Load image bytes from an http(s) or data: URL"""
+        if url.startswith("data:"):
+            header, _, payload = url.partition(",")
+            return base64.b64decode(payload) if header.endswith(";base64") else payload.encode()
+        async with self._get_session().get(url) as response:
+            response.raise_for_status()
+            return await response.read()
+
+    async def store_from_url(self, url: str) -> str:
+        """Download an upstream result and return its storage key"""
+        return await self.put_image(await self.fetch(url))
+
+    def public_url(self, key: str) -> str:
+        return f"{settings.API_URL.rstrip('/')}/api/images/{key}"
+
+
+def is_storage_key(value: str) -> bool:
+    return bool(KEY_PATTERN.match(value))
+
+
+def resolve_image_urls(processed_file_id: Optional[str]) -> List[str]:
+    """Turn stored keys (or legacy upstream URLs) into client-facing URLs"""
+    if not processed_file_id:
+        return []
+    urls = []
+    for item in processed_file_id.split(","):
+        item = item.strip()
+        if item:
+            urls.append(image_storage.public_url(item) if is_storage_key(item) else item)
+    return urls
+
+
+image_storage = ImageStorage(LocalStorageBackend(settings.STORAGE_DIR))
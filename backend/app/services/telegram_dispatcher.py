@@ -0,0 +1,196 @@
+import asyncio
+import time
+from typing import Dict, Optional
+import aiohttp
+from ..config import settings
+
+# A message is given up after this many 429s in a row
+MAX_FLOOD_WAITS = 5
+
+
+class OutgoingMessage:
+    def __init__(self, chat_id: int, text: str, parse_mode: Optional[str], future: Optional[asyncio.Future]):
+        self.chat_id = chat_id
+        self.text = text
+        self.parse_mode = parse_mode
+        self.future = future
+        self.attempts = 0
+        self.flood_waits = 0
+
+
+class TelegramDispatcher:
+    """
+    Single outbound path to the Telegram Bot API
+    One pooled session and a bounded send queue drained by a few workers.
+    Sends are paced to stay under Telegram's limits (about 30 messages/s per
+    bot and 1 message/s per chat); a 429 pauses sending for its retry_after
+    and the message is retried. Callers either enqueue and return, or await
+    the outcome with a timeout.
+    """
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._global_lock = asyncio.Lock()
+        self._next_global = 0.0
+        self._next_per_chat: Dict[int, float] = {}
+        self._paused_until = 0.0
+        self.sent = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.dropped = 0
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=settings.TELEGRAM_POOL_SIZE, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=settings.TELEGRAM_REQUEST_TIMEOUT)
+            )
+        self._start_workers()
+
+    def _start_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=settings.TELEGRAM_SEND_QUEUE_SIZE)
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker())
+                for _ in range(max(1, settings.TELEGRAM_SEND_WORKERS))
+            ]
+
+    async def close(self):
+        """Stop after flushing what is queued (bounded by TELEGRAM_REQUEST_TIMEOUT)"""
+        if self._queue is not None and not self._queue.empty():
+            try:
+                await asyncio.wait_for(self._queue.join(), settings.TELEGRAM_REQUEST_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def enqueue_message(self, chat_id: int, text: str, parse_mode: Optional[str] = "HTML") -> Optional[asyncio.Future]:
+        """Queue a message and return at once; the future resolves to True/False once it is sent"""
+        # Outside the app lifespan (scripts) workers start here and the session on first send
+        self._start_workers()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(OutgoingMessage(chat_id, text, parse_mode, future))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"Telegram send queue full, dropping message to {chat_id}")
+            future.set_result(False)
+        return future
+
+    async def send_message(
+        self,
+        chat_id: int,
+        text: str,
+        parse_mode: Optional[str] = "HTML",
+        wait: Optional[float] = None
+    ) -> Optional[bool]:
+        """
+        Queue a message and wait up to `wait` seconds for the outcome
+        Returns None if it is still queued when the wait ends (it will be sent).
+        """
+        future = self.enqueue_message(chat_id, text, parse_mode)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), wait)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _wait_for_slot(self, chat_id: int):
+        """Pace sends: global rate, per-chat interval and any 429 pause"""
+        async with self._global_lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_global, self._paused_until)
+            self._next_global = start_at + 1.0 / max(1.0, settings.TELEGRAM_GLOBAL_RATE)
+        chat_at = self._next_per_chat.get(chat_id, 0.0)
+        start_at = max(start_at, chat_at)
+        self._next_per_chat[chat_id] = start_at + settings.TELEGRAM_PER_CHAT_INTERVAL
+        delay = start_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        # Forget chats that have been quiet for a while
+        if len(self._next_per_chat) > 10000:
+            cutoff = time.monotonic()
+            self._next_per_chat = {chat: at for chat, at in self._next_per_chat.items() if at > cutoff}
+
+    async def _worker(self):
+        while True:
+            message = await self._queue.get()
+            try:
+                await self._deliver(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Telegram dispatcher error: {e}")
+                self._finish(message, False)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, message: OutgoingMessage):
+        if self._session is None or self._session.closed:
+            await self.start()
+        url = f"{settings.TELEGRAM_API_BASE_URL.rstrip('/')}/bot{settings.BOT_TOKEN}/sendMessage"
+        payload = {"chat_id": message.chat_id, "text": message.text}
+        if message.parse_mode:
+            payload["parse_mode"] = message.parse_mode
+
+        while True:
+            message.attempts += 1
+            await self._wait_for_slot(message.chat_id)
+            try:
+                async with self._session.post(url, json=payload) as response:
+                    result = await response.json(content_type=None)
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                result, status = {"description": str(e)}, None
+
+            if result.get("ok"):
+                self.sent += 1
+                self._finish(message, True)
+                return
+
+            if status == 429:
+                # Flood control: pause the whole bot for the advised time
+                self.rate_limited += 1
+                retry_after = (result.get("parameters") or {}).get("retry_after", 1)
+                resume_at = time.monotonic() + retry_after
+                self._paused_until = max(self._paused_until, resume_at)
+                self._next_per_chat[message.chat_id] = max(self._next_per_chat.get(message.chat_id, 0.0), resume_at)
+                message.flood_waits += 1
+                message.attempts -= 1
+                if message.flood_waits <= MAX_FLOOD_WAITS:
+                    continue
+            elif (status is None or status >= 500) and message.attempts <= settings.TELEGRAM_SEND_RETRIES:
+                await asyncio.sleep(2 ** (message.attempts - 1))
+                continue
+
+            # Permanent failure (blocked by user, bad chat id, ...) or out of retries
+            self.failed += 1
+            print(f"Failed to send Telegram message to {message.chat_id}: {result.get('description')}")
+            self._finish(message, False)
+            return
+
+    @staticmethod
+    def _finish(message: OutgoingMessage, ok: bool):
+        if message.future is not None and not message.future.done():
+            message.future.set_result(ok)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "sent": self.sent,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+            "dropped": self.dropped
+        }
+
+
+telegram_dispatcher = TelegramDispatcher()
@@ -0,0 +1,401 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Hashable, Optional, Set, Tuple
+from fastapi import WebSocket
+from ..config import settings
+from .pubsub import PubSubBackend, create_pubsub
+from .event_log import GenerationEventLog, next_seq
+from .ws_protocol import JSON, Frame, encode_message, negotiate
+
+logger = logging.getLogger(__name__)
+
+# Generation statuses that only report progress; newer ones supersede older ones
+PROGRESS_STATUSES = {
+    "pending",
+    "queued",
+    "uploading",
+    "analyzing",
+    "generating_prompt",
+    "generating_images",
+}
+
+
+class Connection:
+    """
+    One WebSocket with its own bounded outbound queue and writer task
+    Producers never await the socket: they enqueue and return. Progress
+    messages (those with a coalesce key) are replaced or dropped under
+    backpressure; if the queue is full of messages that must not be dropped,
+    the client is too slow and the connection is closed.
+    """
+    def __init__(self, hub: "WebSocketHub", websocket: WebSocket, user_id: int, protocol: str = JSON):
+        self.hub = hub
+        self.websocket = websocket
+        self.user_id = user_id
+        self.protocol = protocol
+        self.connected_at = time.monotonic()
+        self.last_seen = self.connected_at  # Last message received from the client
+        self.max_size = max(1, settings.WS_SEND_QUEUE_SIZE)
+        self._queue: Deque[Tuple[Optional[Hashable], Frame]] = deque()
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._writer = asyncio.create_task(self._write_loop())
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def touch(self):
+        """Record client activity (any received message, including pongs)"""
+        self.last_seen = time.monotonic()
+
+    def send(self, message: dict, coalesce_key: Optional[Hashable] = None) -> bool:
+        """Enqueue a message without waiting for the client"""
+        return self.send_frame(encode_message(message, self.protocol), coalesce_key)
+
+    def send_frame(self, frame: Frame, coalesce_key: Optional[Hashable] = None) -> bool:
+        """
+        Enqueue an already serialized message
+        Returns False if the connection is closed (or was closed as too slow).
+        """
+        if self._closed:
+            return False
+
+        if coalesce_key is not None and settings.WS_PROGRESS_POLICY == "coalesce":
+            # Drop the stale frame and append the new one at the tail: replacing it
+            # in place could send a newer seq ahead of frames queued after the old one
+            for index, (key, _) in enumerate(self._queue):
+                if key == coalesce_key:
+                    del self._queue[index]
+                    self.hub.coalesced += 1
+                    break
+
+        if len(self._queue) >= self.max_size:
+            if coalesce_key is not None:
+                self.hub.dropped += 1
+                return True
+            if not self._drop_oldest_progress():
+                logger.warning(f"WebSocket send queue full for user {self.user_id}, closing slow connection")
+                self.hub.slow_closed += 1
+                self.close()
+                return False
+
+        self._queue.append((coalesce_key, frame))
+        self._ready.set()
+        return True
+
+    def _drop_oldest_progress(self) -> bool:
+        for index, (key, _) in enumerate(self._queue):
+            if key is not None:
+                del self._queue[index]
+                self.hub.dropped += 1
+                return True
+        return False
+
+    async def _write_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                while self._queue:
+                    _, frame = self._queue.popleft()
+                    # Bounded number of sockets written at once across the process
+                    async with self.hub.write_slots:
+                        send = self.websocket.send_bytes if isinstance(frame, bytes) else self.websocket.send_text
+                        await asyncio.wait_for(send(frame), settings.WS_SEND_TIMEOUT)
+                self._ready.clear()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # Dead or stalled socket: reap it quietly, the counter tells the story
+            self.hub.send_failures += 1
+            logger.debug(f"WebSocket send failed for user {self.user_id}: {e!r}")
+        finally:
+            self._closed = True
+            self.hub.disconnect(self)
+
+    def close(self, code: int = 1000):
+        """Stop writing and drop the connection from the hub"""
+        if self._closed:
+            return
+        self._closed = True
+        self._writer.cancel()
+        self.hub.disconnect(self)
+        asyncio.create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), settings.WS_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+
+def status_coalesce_key(data: dict) -> Optional[Hashable]:
+    if data.get("status") in PROGRESS_STATUSES:
+        return ("generation", data.get("image_id"))
+    return None
+
+
+class WebSocketHub:
+    """
+    Single registry of WebSocket connections; any number of tabs per user
+    send_to_user() reaches sockets held by this process only; publish() also
+    forwards the message through the pub/sub backend so the sockets a user
+    holds on other API workers or nodes get it too.
+    """
+    def __init__(self, pubsub: Optional[PubSubBackend] = None):
+        self.active_connections: Dict[int, Set[Connection]] = {}
+        self.pubsub = pubsub or create_pubsub()
+        self.events = GenerationEventLog()
+        self.write_slots = asyncio.Semaphore(max(1, settings.WS_SEND_CONCURRENCY))
+        self.send_failures = 0
+        self.broadcasts = 0
+        self.broadcast_enqueue_failures = 0
+        self.last_broadcast: Optional[dict] = None
+        self._fanout_tasks: Set[asyncio.Task] = set()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.idle = 0  # Connections silent for a ping interval or more at the last sweep
+        self.reaped = 0
+        self.evicted = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.slow_closed = 0
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        accept: bool = True,
+        last_seq: Optional[int] = None,
+        protocol: Optional[str] = None
+    ) -> Connection:
+        """
+        Register a socket; with `last_seq`, replay the events it missed first
+        When accepting here, the wire protocol is negotiated from the
+        client's subprotocols (JSON unless it offers MessagePack).
+        """
+        if accept:
+            protocol, subprotocol = negotiate(websocket)
+            await websocket.accept(subprotocol=subprotocol)
+        connection = Connection(self, websocket, user_id, protocol or JSON)
+        connections = self.active_connections.setdefault(user_id, set())
+        while len(connections) >= max(1, settings.WS_MAX_CONNECTIONS_PER_USER):
+            # Over the per-user cap: the oldest tab gives way to the new one
+            oldest = min(connections, key=lambda c: c.connected_at)
+            self.evicted += 1
+            oldest.close(code=1008)
+            self.disconnect(oldest)
+        connections.add(connection)
+        if last_seq is not None:
+            # No await since registration: no live event can slip in before the replay
+            self.resume(connection, last_seq)
+        logger.info(f"WebSocket connected for user {user_id}")
+        return connection
+
+    def resume(self, connection: Connection, last_seq: int):
+        """Queue generation events after `last_seq` (or job snapshots if they are gone)"""
+        missed, snapshots = self.events.replay(connection.user_id, last_seq)
+        if snapshots is not None:
+            connection.send({"type": "snapshot", "jobs": snapshots})
+        for message in missed:
+            connection.send(message)
+        connection.send({"type": "resumed", "last_seq": last_seq, "replayed": len(missed)})
+
+    def disconnect(self, connection: Connection):
+        connections = self.active_connections.get(connection.user_id)
+        if connections is None or connection not in connections:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self.active_connections[connection.user_id]
+        if not connection._closed:
+            connection.close()
+        logger.info(f"WebSocket disconnected for user {connection.user_id}")
+
+    async def start(self):
+        await self.pubsub.start(self._on_remote_message)
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def close(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+        self.close_all()
+        await self.pubsub.close()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(settings.WS_PING_INTERVAL)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"WebSocket heartbeat error: {e}")
+
+    def sweep(self):
+        """
+        Ping quiet sockets and reap silent ones
+        A connection that has sent nothing (not even a pong) for
+        WS_IDLE_TIMEOUT seconds is a closed laptop or a dead network path:
+        it is closed and evicted instead of collecting failed sends.
+        """
+        now = time.monotonic()
+        frames: Dict[str, Frame] = {}
+        ping = {"type": "ping", "timestamp": int(time.time())}
+        idle = 0
+        for group in list(self.active_connections.values()):
+            for connection in list(group):
+                silent = now - connection.last_seen
+                if silent >= settings.WS_IDLE_TIMEOUT:
+                    self.reaped += 1
+                    connection.close(code=1001)
+                elif silent >= settings.WS_PING_INTERVAL:
+                    idle += 1
+                    connection.send_frame(self._frame(frames, ping, connection.protocol), ("ping",))
+        self.idle = idle
+
+    def send_to_user(self, user_id: int, message: dict, coalesce_key: Optional[Hashable] = None):
+        """Deliver to this process's sockets of the user"""
+        connections = self.active_connections.get(user_id)
+        if not connections:
+            return
+        frames: Dict[str, Frame] = {}
+        for connection in list(connections):
+            connection.send_frame(self._frame(frames, message, connection.protocol), coalesce_key)
+
+    @staticmethod
+    def _frame(frames: Dict[str, Frame], message: dict, protocol: str) -> Frame:
+        """Encode a message at most once per protocol"""
+        frame = frames.get(protocol)
+        if frame is None:
+            frame = frames[protocol] = encode_message(message, protocol)
+        return frame
+
+    def publish(
+        self,
+        user_id: Optional[int],
+        message: dict,
+        coalesce_key: Optional[Hashable] = None,
+        event: bool = False
+    ):
+        """
+        Deliver to the user's sockets on every node (user_id None: everyone)
+        `event` marks sequenced generation events that every node records
+        for replay.
+        """
+        if event:
+            self.events.record(user_id, message)
+        if user_id is None:
+            self._spawn_fanout(message)
+        else:
+            self.send_to_user(user_id, message, coalesce_key)
+        self.pubsub.publish({
+            "user_id": user_id,
+            "message": message,
+            "coalesce_key": list(coalesce_key) if coalesce_key is not None else None,
+            "event": event
+        })
+
+    def _on_remote_message(self, envelope: dict):
+        coalesce_key = envelope.get("coalesce_key")
+        message = envelope.get("message") or {}
+        user_id = envelope.get("user_id")
+        if user_id is None:
+            self._spawn_fanout(message)
+            return
+        if envelope.get("event"):
+            self.events.record(user_id, message)
+        self.send_to_user(user_id, message, tuple(coalesce_key) if coalesce_key is not None else None)
+
+    def _spawn_fanout(self, message: dict):
+        task = asyncio.create_task(self.fanout(message))
+        self._fanout_tasks.add(task)
+        task.add_done_callback(self._fanout_tasks.discard)
+
+    async def fanout(self, message: dict) -> dict:
+        """
+        Queue one message on every socket of this process
+        The payload is encoded once per protocol; sockets are visited in batches with a
+        yield to the event loop in between, so thousands of connections never
+        stall other requests. Closed sockets are skipped and reaped.
+        The result measures enqueueing only: frames are written later by each
+        connection's writer, whose failures are counted in send_failures.
+        """
+        started = time.perf_counter()
+        frames: Dict[str, Frame] = {}
+        connections = [connection for group in self.active_connections.values() for connection in group]
+        batch = max(1, settings.WS_BROADCAST_BATCH)
+        failed = 0
+        for start in range(0, len(connections), batch):
+            for connection in connections[start:start + batch]:
+                if not connection.send_frame(self._frame(frames, message, connection.protocol)):
+                    failed += 1
+                    self.disconnect(connection)
+            await asyncio.sleep(0)
+
+        result = {
+            "connections": len(connections),
+            "enqueue_failed": failed,
+            "enqueue_ms": round((time.perf_counter() - started) * 1000, 2),
+            "send_failures_total": self.send_failures  # Writer failures so far (delivery is async)
+        }
+        self.broadcasts += 1
+        self.broadcast_enqueue_failures += failed
+        self.last_broadcast = result
+        logger.info(
+            f"Broadcast queued on {result['connections']} sockets in {result['enqueue_ms']}ms "
+            f"({failed} not queued, {self.send_failures} writer failures so far)"
+        )
+        return result
+
+    async def send_personal_message(self, message: dict, user_id: int):
+        self.publish(user_id, message)
+
+    async def send_status(self, user_id: int, data: dict, local: bool = False):
+        """
+        Send generation status update to user
+        Published updates get a sequence number and are kept for replay;
+        local ones (queue positions, recomputed on every node) are not.
+        """
+        if local:
+            self.send_to_user(user_id, data, status_coalesce_key(data))
+        else:
+            data = {**data, "seq": next_seq()}
+            self.publish(user_id, data, status_coalesce_key(data), event=True)
+
+    async def broadcast(self, message: dict) -> dict:
+        """Broadcast message to all connected users on every node"""
+        self.pubsub.publish({"user_id": None, "message": message, "coalesce_key": None, "event": False})
+        return await self.fanout(message)
+
+    def close_all(self):
+        for connections in list(self.active_connections.values()):
+            for connection in list(connections):
+                connection.close()
+
+    def stats(self) -> dict:
+        protocols: Dict[str, int] = {}
+        for group in self.active_connections.values():
+            for connection in group:
+                protocols[connection.protocol] = protocols.get(connection.protocol, 0) + 1
+        return {
+            "users": len(self.active_connections),
+            "protocols": protocols,
+            "connections": sum(len(c) for c in self.active_connections.values()),
+            "idle": self.idle,
+            "reaped": self.reaped,
+            "evicted_over_cap": self.evicted,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "slow_closed": self.slow_closed,
+            "send_failures": self.send_failures,
+            "broadcasts": self.broadcasts,
+            "broadcast_enqueue_failures": self.broadcast_enqueue_failures,
+            "last_broadcast": self.last_broadcast,
+            "replay": self.events.stats(),
+            "pubsub": self.pubsub.stats()
+        }
+
+
+hub = WebSocketHub()
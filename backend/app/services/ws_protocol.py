@@ -0,0 +1,93 @@
+import json
+from typing import Optional, Tuple, Union
+from fastapi import WebSocket, WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:  # Compact protocol is optional; JSON always works
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+# Offered by clients in Sec-WebSocket-Protocol to get MessagePack frames
+MSGPACK_SUBPROTOCOL = "photosession.msgpack.v1"
+
+# Numeric generation status codes of the compact protocol (stable: never renumber)
+STATUS_CODES = {
+    "pending": 1,
+    "queued": 2,
+    "uploading": 3,
+    "analyzing": 4,
+    "generating_prompt": 5,
+    "generating_images": 6,
+    "image_ready": 7,
+    "completed": 8,
+    "failed": 9,
+}
+
+Frame = Union[str, bytes]
+
+
+def negotiate(websocket: WebSocket) -> Tuple[str, Optional[str]]:
+    """(protocol, subprotocol to accept with) for a connecting client"""
+    offered = websocket.scope.get("subprotocols") or []
+    if msgpack is not None and MSGPACK_SUBPROTOCOL in offered:
+        return MSGPACK, MSGPACK_SUBPROTOCOL
+    return JSON, None
+
+
+def compact(message: dict) -> dict:
+    """
+    Compact form of a message: numeric status code, and no localized text
+    for known statuses (clients resolve it from the code). Error details of
+    failed jobs are kept.
+    """
+    if message.get("type") not in (None, "generation_update"):
+        return message  # e.g. payment_update has statuses of its own
+    code = STATUS_CODES.get(message.get("status"))
+    if code is None:
+        return message
+    compacted = {key: value for key, value in message.items() if value is not None}
+    compacted["status"] = code
+    if code != STATUS_CODES["failed"]:
+        compacted.pop("message", None)
+    return compacted
+
+
+def encode_message(message: dict, protocol: str = JSON) -> Frame:
+    """Serialize a message for one protocol; the frame is shared by every socket using it"""
+    if protocol == MSGPACK:
+        return msgpack.packb(compact(message), use_bin_type=True)
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_message(data: Frame) -> dict:
+    """Parse a client frame (JSON text or MessagePack binary); ValueError if invalid"""
+    try:
+        message = msgpack.unpackb(data, raw=False) if isinstance(data, bytes) else json.loads(data)
+    except Exception as e:
+        raise ValueError(f"Invalid message: {e}") from e
+    if not isinstance(message, dict):
+        raise ValueError("Message must be an object")
+    return message
+
+
+async def receive_message(websocket: WebSocket) -> dict:
+    """Next client message in either protocol; raises WebSocketDisconnect or ValueError"""
+    raw = await websocket.receive()
+    if raw["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(raw.get("code", 1000))
+    data = raw.get("bytes")
+    if data is not None and msgpack is None:
+        raise ValueError("Binary frames are not supported")
+    return decode_message(data if data is not None else raw.get("text") or "")
+
+
+async def send_message(websocket: WebSocket, message: dict, protocol: str = JSON):
+    """Send directly, for replies before a connection is registered in the hub"""
+    frame = encode_message(message, protocol)
+    if isinstance(frame, bytes):
+        await websocket.send_bytes(frame)
+    else:
+        await websocket.send_text(frame)
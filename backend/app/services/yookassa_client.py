@@ -0,0 +1,164 @@
+import asyncio
+import bisect
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import aiohttp
+from ..config import settings
+
+# Upper bounds (ms) of the payment creation latency buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class YooKassaError(Exception):
+    """Non-success response from the YooKassa API"""
+    def __init__(self, status: int, message: str):
+        super().__init__(f"YooKassa HTTP {status}: {message[:200]}")
+        self.status = status
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (cumulative counts per upper bound, like Prometheus)"""
+    def __init__(self, bounds_ms=LATENCY_BUCKETS_MS):
+        self.bounds_ms = bounds_ms
+        self.counts: List[int] = [0] * (len(bounds_ms) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(self.bounds_ms, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+
+    def stats(self) -> dict:
+        buckets = {}
+        running = 0
+        for bound, count in zip(self.bounds_ms, self.counts):
+            running += count
+            buckets[f"le_{bound}ms"] = running
+        buckets["inf"] = self.total
+        return {
+            "count": self.total,
+            "average_ms": round(self.sum_ms / self.total, 1) if self.total else None,
+            "buckets": buckets
+        }
+
+
+class YooKassaClient:
+    """
+    Payment creation without blocking the event loop
+    The default "async" mode calls the REST API over a pooled aiohttp session
+    with timeouts, retrying network errors, 429 and 5xx with the same
+    Idempotence-Key so a retried request can never create a second payment.
+    The "thread" mode runs the synchronous SDK in a small bounded pool instead.
+    """
+    def __init__(self, mode: str):
+        self.mode = mode
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.latency = LatencyHistogram()
+        self.created = 0
+        self.failed = 0
+        self.retries = 0
+
+    async def start(self):
+        if self.mode == "thread":
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max(1, settings.YOOKASSA_THREAD_POOL_SIZE),
+                    thread_name_prefix="yookassa"
+                )
+            return
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=settings.YOOKASSA_POOL_SIZE,
+            keepalive_timeout=60,
+            ttl_dns_cache=300
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            auth=aiohttp.BasicAuth(settings.YOOKASSA_SHOP_ID, settings.YOOKASSA_SECRET_KEY),
+            timeout=aiohttp.ClientTimeout(
+                total=settings.YOOKASSA_TIMEOUT,
+                connect=min(5.0, settings.YOOKASSA_TIMEOUT)
+            )
+        )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def create_payment(self, payload: dict, idempotence_key: str) -> dict:
+        """
+        Create a payment and return {"id": ..., "confirmation_url": ...}
+        Raises YooKassaError (or the SDK's error in thread mode) on failure.
+        """
+        await self.start()
+        started = time.perf_counter()
+        try:
+            if self.mode == "thread":
+                result = await self._create_in_thread(payload, idempotence_key)
+            else:
+                result = await self._create_async(payload, idempotence_key)
+            self.created += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.latency.observe(time.perf_counter() - started)
+
+    async def _create_async(self, payload: dict, idempotence_key: str) -> dict:
+        url = f"{settings.YOOKASSA_API_URL.rstrip('/')}/payments"
+        headers = {"Idempotence-Key": idempotence_key}
+        retries = max(0, settings.YOOKASSA_RETRIES)
+        last_error: Exception = None
+
+        for attempt in range(retries + 1):
+            try:
+                async with self._session.post(url, json=payload, headers=headers) as response:
+                    if response.status >= 400:
+                        raise YooKassaError(response.status, await response.text())
+                    result = await response.json(content_type=None)
+                return {
+                    "id": result["id"],
+                    "confirmation_url": (result.get("confirmation") or {}).get("confirmation_url")
+                }
+            except YooKassaError as e:
+                if e.status < 500 and e.status != 429:
+                    raise  # Invalid request or credentials: retrying will not help
+                last_error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = e
+
+            if attempt < retries:
+                self.retries += 1
+                await asyncio.sleep(random.uniform(0, 0.5 * 2 ** attempt))  # Full jitter
+
+        raise last_error
+
+    async def _create_in_thread(self, payload: dict, idempotence_key: str) -> dict:
+        from yookassa import Payment
+
+        loop = asyncio.get_running_loop()
+        payment = await loop.run_in_executor(self._executor, Payment.create, payload, idempotence_key)
+        return {"id": payment.id, "confirmation_url": payment.confirmation.confirmation_url}
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "created": self.created,
+            "failed": self.failed,
+            "retries": self.retries,
+            "latency": self.latency.stats()
+        }
+
+
+yookassa_client = YooKassaClient(settings.YOOKASSA_CLIENT)
@@ -2,7 +2,7 @@ import hashlib
 import hmac
 from typing import Dict
 from ..config import settings
-import aiohttp
+from ..services.telegram_dispatcher import telegram_dispatcher
 
 def verify_telegram_auth(auth_data: Dict[str, any]) -> bool:
     """
@@ -35,9 +35,10 @@ def verify_telegram_auth(auth_data: Dict[str, any]) -> bool:
 async def send_verification_code(telegram_id: int, code: str) -> bool:
     """
     Send verification code to user via Telegram bot
+    Goes through the shared dispatcher and waits up to TELEGRAM_SEND_WAIT
+    seconds; a message still queued behind rate limits counts as sent.
     """
     try:
-        url = f"https://api.telegram.org/bot{settings.BOT_TOKEN}/sendMessage"
         message = (
             f"🔐 <b>Код для входа на сайт</b>\n\n"
             f"Ваш код: <code>{code}</code>\n\n"
@@ -45,14 +46,8 @@ async def send_verification_code(telegram_id: int, code: str) -> bool:
             f"Не сообщайте этот код никому!"
         )
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json={
-                "chat_id": telegram_id,
-                "text": message,
-                "parse_mode": "HTML"
-            }) as response:
-                result = await response.json()
-                return result.get("ok", False)
+        result = await telegram_dispatcher.send_message(telegram_id, message, wait=settings.TELEGRAM_SEND_WAIT)
+        return result is not False
     except Exception as e:
         print(f"Error sending verification code: {e}")
         return False
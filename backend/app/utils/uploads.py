@@ -0,0 +1,87 @@
+from fastapi import HTTPException, Request, status
+from starlette.datastructures import FormData, UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+from typing import AsyncGenerator
+
+# Allowance for multipart boundaries and text fields on top of the file itself
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Upload is larger than {max_bytes // (1024 * 1024)} MB"
+    )
+
+async def _limited_stream(request: Request, limit: int) -> AsyncGenerator[bytes, None]:
+    """Yield request body chunks, aborting once more than `limit` bytes arrived"""
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise _too_large(limit - FORM_OVERHEAD_BYTES)
+        yield chunk
+
+def _close_partial_files(parser: MultiPartParser):
+    """
+    Close temp files of parts spooled before parsing was aborted
+    Starlette keeps them in private parser attributes (hence the pin in
+    requirements.txt); if those change, say so instead of leaking quietly.
+    """
+    try:
+        candidates = [value for _, value in parser.items]
+        candidates += parser._files_to_close_on_error
+        candidates.append(parser._current_part.file)
+    except AttributeError as e:
+        print(f"Cannot close partial upload files, check MultiPartParser internals: {e}")
+        return
+    for item in candidates:
+        spooled = item.file if isinstance(item, UploadFile) else item
+        if spooled is not None:
+            spooled.close()
+
+async def read_limited_form(request: Request, max_bytes: int) -> FormData:
+    """
+    Parse a multipart/form-data body without buffering it in memory
+    File parts are spooled to temporary files; the request is rejected with 413
+    before the body is fully read if it is bigger than `max_bytes`.
+    """
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("multipart/form-data"):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Expected multipart/form-data"
+        )
+
+    limit = max_bytes + FORM_OVERHEAD_BYTES
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        raise _too_large(max_bytes)
+
+    parser = MultiPartParser(request.headers, _limited_stream(request, limit), max_files=1, max_fields=10)
+    parsed = False
+    try:
+        form = await parser.parse()
+        parsed = True
+        return form
+    except MultiPartException as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.message)
+    finally:
+        # 413 partway through the body (or a malformed part): release spooled parts
+        if not parsed:
+            _close_partial_files(parser)
+
+async def read_upload_file(form: FormData, field: str) -> bytes:
+    """Read a file field from a parsed form into a single buffer"""
+    upload = form.get(field)
+    if not isinstance(upload, UploadFile):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Missing file field '{field}'"
+        )
+    data = await upload.read()
+    if not data:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid image data"
+        )
+    return data
@@ -1,57 +1,131 @@
-import random
+import heapq
+import secrets
 import string
+import time
+from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
-from typing import Optional, Dict
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..config import settings
+from ..database.crud import (
+    upsert_verification_code,
+    consume_verification_code,
+    delete_expired_verification_codes
+)
+
+
+class VerificationCodeStore(ABC):
+    """Where login codes live between /request-code and /verify-code"""
+    @abstractmethod
+    async def put(self, db: AsyncSession, username: str, code: str, telegram_id: int):
+        ...
+
+    @abstractmethod
+    async def verify(self, db: AsyncSession, username: str, code: str) -> Optional[int]:
+        """telegram_id if the code matches; each wrong guess uses up an attempt"""
+
+    def stats(self) -> dict:
+        return {"backend": type(self).__name__}
+
+
+class MemoryCodeStore(VerificationCodeStore):
+    """
+    Single-process store: dict lookups, expiry through a min-heap
+    Expired entries are popped from the heap top on every call, so memory
+    stays bounded by the codes issued within one expiry window.
+    """
+    def __init__(self):
+        self._codes: Dict[str, dict] = {}
+        self._expiry: List[Tuple[float, int, str]] = []  # (expires_at, version, username)
+        self._version = 0
+        self.expired = 0
+        self.locked_out = 0
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._expiry and self._expiry[0][0] <= now:
+            _, version, username = heapq.heappop(self._expiry)
+            entry = self._codes.get(username)
+            # Skip heap entries of codes that were replaced or already used
+            if entry is not None and entry["version"] == version:
+                del self._codes[username]
+                self.expired += 1
+
+    async def put(self, db: AsyncSession, username: str, code: str, telegram_id: int):
+        self._expire()
+        self._version += 1
+        expires_at = time.monotonic() + settings.VERIFICATION_CODE_EXPIRE_MINUTES * 60
+        self._codes[username] = {
+            "code": code,
+            "telegram_id": telegram_id,
+            "attempts": 0,
+            "version": self._version
+        }
+        heapq.heappush(self._expiry, (expires_at, self._version, username))
+
+    async def verify(self, db: AsyncSession, username: str, code: str) -> Optional[int]:
+        self._expire()
+        entry = self._codes.get(username)
+        if entry is None:
+            return None
+        if not secrets.compare_digest(entry["code"], code):
+            entry["attempts"] += 1
+            if entry["attempts"] >= settings.VERIFICATION_CODE_MAX_ATTEMPTS:
+                del self._codes[username]
+                self.locked_out += 1
+            return None
+        del self._codes[username]
+        return entry["telegram_id"]
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "active": len(self._codes),
+            "expired": self.expired,
+            "locked_out": self.locked_out
+        }
+
+
+class PostgresCodeStore(VerificationCodeStore):
+    """
+    Codes in the shared verification_codes table, so any worker can verify
+    a code another one issued. Lookups go by primary key; expired rows are
+    swept at most once a minute.
+    """
+    def __init__(self):
+        self._swept_at = 0.0
+
+    async def put(self, db: AsyncSession, username: str, code: str, telegram_id: int):
+        expires_at = datetime.utcnow() + timedelta(minutes=settings.VERIFICATION_CODE_EXPIRE_MINUTES)
+        await upsert_verification_code(db, username, code, telegram_id, expires_at)
+        if time.monotonic() - self._swept_at > 60:
+            self._swept_at = time.monotonic()
+            await delete_expired_verification_codes(db)
+
+    async def verify(self, db: AsyncSession, username: str, code: str) -> Optional[int]:
+        return await consume_verification_code(db, username, code, settings.VERIFICATION_CODE_MAX_ATTEMPTS)
+
+
+def create_code_store() -> VerificationCodeStore:
+    if settings.VERIFICATION_CODE_STORE == "postgres":
+        return PostgresCodeStore()
+    return MemoryCodeStore()
+
+
+code_store = create_code_store()
 
-# In-memory storage for verification codes
-# In production, use Redis or database
-verification_codes: Dict[str, Dict] = {}
 
 def generate_verification_code() -> str:
     """Generate 6-digit verification code"""
-    return ''.join(random.choices(string.digits, k=6))
+    return ''.join(secrets.choice(string.digits) for _ in range(6))
 
-def store_verification_code(username: str, code: str, telegram_id: int):
+async def store_verification_code(db: AsyncSession, username: str, code: str, telegram_id: int):
     """Store verification code with expiration"""
-    expires_at = datetime.utcnow() + timedelta(minutes=settings.VERIFICATION_CODE_EXPIRE_MINUTES)
-    verification_codes[username.lower()] = {
-        "code": code,
-        "telegram_id": telegram_id,
-        "expires_at": expires_at
-    }
-
-def verify_code(username: str, code: str) -> Optional[int]:
+    await code_store.put(db, username.lower(), code, telegram_id)
+
+async def verify_code(db: AsyncSession, username: str, code: str) -> Optional[int]:
     """
     Verify code and return telegram_id if valid
-    Returns None if invalid or expired
+    Returns None if invalid, expired or out of attempts
     """
-    username = username.lower()
-    if username not in verification_codes:
-        return None
-
-    stored_data = verification_codes[username]
-
-    # Check expiration
-    if datetime.utcnow() > stored_data["expires_at"]:
-        del verification_codes[username]
-        return None
-
-    # Check code
-    if stored_data["code"] != code:
-        return None
-
-    # Valid code - remove it and return telegram_id
-    telegram_id = stored_data["telegram_id"]
-    del verification_codes[username]
-    return telegram_id
-
-def cleanup_expired_codes():
-    """Remove expired codes"""
-    now = datetime.utcnow()
-    expired_usernames = [
-        username for username, data in verification_codes.items()
-        if now > data["expires_at"]
-    ]
-    for username in expired_usernames:
-        del verification_codes[username]
+    return await code_store.verify(db, username.lower(), code)
@@ -0,0 +1,230 @@
+"""
+Local stand-in for OpenRouter, the Telegram Bot API and YooKassa
+Lets the backend be load-tested without spending money. Point the backend at it:
+    OPENROUTER_BASE_URL=http://localhost:9000/api/v1
+    TELEGRAM_API_BASE_URL=http://localhost:9000
+    YOOKASSA_API_URL=http://localhost:9000/v3
+and run:
+    python mock_upstream.py --port 9000 \\
+        --latency openrouter=lognormal:1.5,0.4 --latency telegram=fixed:0.05 \\
+        --error-rate openrouter=0.02 --rate-limit openrouter=0.05 \\
+        --webhook-url http://localhost:8000/api/payments/webhook
+
+Latency specs: fixed:S | uniform:MIN,MAX | normal:MEAN,STDDEV | lognormal:MEDIAN,SIGMA (seconds).
+Per-service options take SERVICE=VALUE with SERVICE in openrouter, telegram, yookassa or *.
+"""
+import argparse
+import asyncio
+import math
+import random
+import struct
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import Callable, Dict
+from aiohttp import ClientSession, web
+
+SERVICES = ("openrouter", "telegram", "yookassa")
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def parse_per_service(items, convert) -> Dict[str, object]:
+    result = {}
+    for item in items or []:
+        service, _, value = item.partition("=")
+        if service not in SERVICES + ("*",) or not value:
+            raise ValueError(f"Expected SERVICE=VALUE, got {item}")
+        result[service] = convert(value)
+    for service in SERVICES:
+        if service not in result and "*" in result:
+            result[service] = result["*"]
+    return result
+
+
+def solid_png(width: int, height: int, rgb: tuple) -> bytes:
+    """Tiny dependency-free PNG encoder for placeholder results"""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    row = b"\x00" + bytes(rgb) * width
+    raw = zlib.compress(row * height, 9)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", raw) + chunk(b"IEND", b"")
+
+
+class MockUpstream:
+    def __init__(self, args):
+        default_latency = {service: parse_latency("fixed:0") for service in SERVICES}
+        self.latency = {**default_latency, **parse_per_service(args.latency, parse_latency)}
+        self.error_rate = parse_per_service(args.error_rate, float)
+        self.rate_limit = parse_per_service(args.rate_limit, float)
+        self.image_size = args.image_size
+        self.webhook_url = args.webhook_url
+        self.webhook_delay = args.webhook_delay
+        self.payments: Dict[str, dict] = {}  # Idempotence-Key -> payment
+        self.images: Dict[str, bytes] = {}
+        self.counters = {service: {"requests": 0, "errors": 0, "rate_limited": 0} for service in SERVICES}
+        self._client: ClientSession = None
+
+    async def simulate(self, service: str):
+        """Sleep for the configured latency; return an error response to send, if any"""
+        counters = self.counters[service]
+        counters["requests"] += 1
+        await asyncio.sleep(self.latency[service]())
+        if random.random() < self.rate_limit.get(service, 0.0):
+            counters["rate_limited"] += 1
+            if service == "telegram":
+                return web.json_response(
+                    {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                     "parameters": {"retry_after": 1}},
+                    status=429
+                )
+            return web.json_response({"error": {"message": "Rate limited"}}, status=429, headers={"Retry-After": "1"})
+        if random.random() < self.error_rate.get(service, 0.0):
+            counters["errors"] += 1
+            return web.json_response({"error": {"message": "Injected upstream error"}}, status=500)
+        return None
+
+    # OpenRouter
+    async def chat_completions(self, request: web.Request):
+        error = await self.simulate("openrouter")
+        if error:
+            return error
+        payload = await request.json()
+        content = payload.get("messages", [{}])[-1].get("content")
+        text = "A product photographed on a neutral background" if isinstance(content, list) else f"Prompt: {str(content)[:200]}"
+        return web.json_response({
+            "id": f"gen-{uuid.uuid4().hex}",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}]
+        })
+
+    async def image_generations(self, request: web.Request):
+        error = await self.simulate("openrouter")
+        if error:
+            return error
+        image_id = uuid.uuid4().hex
+        color = tuple(random.randrange(256) for _ in range(3))
+        self.images[image_id] = solid_png(self.image_size, self.image_size, color)
+        return web.json_response({
+            "created": int(time.time()),
+            "data": [{"url": f"{request.scheme}://{request.host}/mock/images/{image_id}.png"}]
+        })
+
+    async def get_image(self, request: web.Request):
+        body = self.images.pop(request.match_info["image_id"], None)
+        if body is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=body, content_type="image/png")
+
+    # Telegram Bot API
+    async def send_message(self, request: web.Request):
+        error = await self.simulate("telegram")
+        if error:
+            return error
+        payload = await request.json() if request.content_type == "application/json" else dict(await request.post())
+        return web.json_response({
+            "ok": True,
+            "result": {
+                "message_id": random.randrange(1, 1 << 31),
+                "date": int(time.time()),
+                "chat": {"id": int(payload.get("chat_id", 0)), "type": "private"},
+                "text": payload.get("text", "")
+            }
+        })
+
+    # YooKassa
+    async def create_payment(self, request: web.Request):
+        error = await self.simulate("yookassa")
+        if error:
+            return error
+        key = request.headers.get("Idempotence-Key") or uuid.uuid4().hex
+        if key in self.payments:
+            return web.json_response(self.payments[key])
+
+        payload = await request.json()
+        payment_id = str(uuid.uuid4())
+        payment = {
+            "id": payment_id,
+            "status": "pending",
+            "paid": False,
+            "amount": payload.get("amount"),
+            "confirmation": {
+                "type": "redirect",
+                "confirmation_url": f"{request.scheme}://{request.host}/mock/pay/{payment_id}"
+            },
+            "created_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+            "description": payload.get("description"),
+            "metadata": payload.get("metadata", {}),
+            "recipient": {"account_id": "mock", "gateway_id": "mock"},
+            "refundable": False,
+            "test": True
+        }
+        self.payments[key] = payment
+        if self.webhook_url:
+            asyncio.create_task(self.send_webhook(payment))
+        return web.json_response(payment)
+
+    async def send_webhook(self, payment: dict):
+        await asyncio.sleep(self.webhook_delay)
+        if self._client is None:
+            self._client = ClientSession()
+        succeeded = {**payment, "status": "succeeded", "paid": True}
+        try:
+            async with self._client.post(self.webhook_url, json={
+                "type": "notification", "event": "payment.succeeded", "object": succeeded
+            }) as response:
+                await response.read()
+        except Exception as e:
+            print(f"Webhook delivery failed: {e}")
+
+    async def stats(self, request: web.Request):
+        return web.json_response(self.counters)
+
+    async def close(self, app):
+        if self._client is not None:
+            await self._client.close()
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/api/v1/chat/completions", self.chat_completions)
+        app.router.add_post("/api/v1/images/generations", self.image_generations)
+        app.router.add_get("/mock/images/{image_id}.png", self.get_image)
+        app.router.add_post("/bot{token}/sendMessage", self.send_message)
+        app.router.add_post("/v3/payments", self.create_payment)
+        app.router.add_get("/mock/stats", self.stats)
+        app.on_cleanup.append(self.close)
+        return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenRouter/Telegram/YooKassa server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", action="append", help="SERVICE=DIST, e.g. openrouter=lognormal:1.5,0.4")
+    parser.add_argument("--error-rate", action="append", help="SERVICE=P of HTTP 500, e.g. *=0.01")
+    parser.add_argument("--rate-limit", action="append", help="SERVICE=P of HTTP 429")
+    parser.add_argument("--image-size", type=int, default=512, help="Side of generated placeholder images")
+    parser.add_argument("--webhook-url", help="Send payment.succeeded here after each created payment")
+    parser.add_argument("--webhook-delay", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible runs")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    print(f"🔧 Mock upstream listening on http://{args.host}:{args.port}")
+    web.run_app(MockUpstream(args).build_app(), host=args.host, port=args.port, print=None)
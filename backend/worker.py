@@ -0,0 +1,53 @@
+"""
+Standalone generation worker
+Runs generation jobs from the shared queue, separately from the API:
+    python worker.py --concurrency 8
+Set GENERATION_WORKER_CONCURRENCY=0 on the API to leave all jobs to workers,
+and WS_PUBSUB_BACKEND=postgres so their progress reaches users' sockets.
+"""
+import argparse
+import asyncio
+import signal
+from app.config import settings
+from app.database import engine, create_site_tables
+from app.services.image_processing import shutdown_executor
+from app.services.job_queue import GenerationWorker
+from app.services.openrouter_client import openrouter_client
+from app.services.storage import image_storage
+from app.services.websocket_hub import hub
+
+async def main(concurrency: int):
+    """Run the worker until SIGINT/SIGTERM"""
+    await create_site_tables()
+    await openrouter_client.start()
+    # Progress events reach API sockets through the pub/sub backend
+    await hub.start()
+
+    worker = GenerationWorker(hub, concurrency)
+    worker.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    await worker.stop()
+    await hub.close()
+    await openrouter_client.close()
+    await image_storage.close()
+    shutdown_executor()
+    await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run generation queue worker")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=max(1, settings.GENERATION_WORKER_CONCURRENCY),
+        help="Number of pipelines to run at once"
+    )
+    args = parser.parse_args()
+    print("🔧 Starting generation worker...")
+    asyncio.run(main(args.concurrency))
+    print("✅ Done!")
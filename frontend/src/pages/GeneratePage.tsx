@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { generationApi } from '../services/generationApi';
 import { useAuth } from '../hooks/useAuth';
@@ -15,6 +15,8 @@ const GeneratePage: React.FC = () => {
   const [aspectRatio, setAspectRatio] = useState('1:1');
   const [status, setStatus] = useState<GenerationStatus | null>(null);
   const [resultImages, setResultImages] = useState<string[]>([]);
+  const lastSeq = useRef(0);
+  const imageId = useRef<number | null>(null);
 
   useEffect(() => {
     if (!isAuthenticated) {
@@ -27,18 +29,91 @@ const GeneratePage: React.FC = () => {
       // Get WebSocket URL from API URL (replace http with ws, https with wss)
       const apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
       const wsUrl = apiUrl.replace(/^http/, 'ws');
-      const websocket = new WebSocket(`${wsUrl}/api/generation/ws/${user.id}`);
-      websocket.onmessage = (event) => {
-        const data = JSON.parse(event.data);
-        if (data.status) {
-          setStatus(data);
-          if (data.status === 'completed') {
-            setResultImages(data.images || []);
-            setStep('result');
-          }
+      let websocket: WebSocket | null = null;
+      let eventSource: EventSource | null = null;
+      let reconnectTimer: ReturnType<typeof setTimeout> | undefined;
+      let stopped = false;
+      let failedUpgrades = 0;
+
+      const applyStatus = (data: GenerationStatus) => {
+        setStatus(data);
+        if (data.status === 'image_ready' && data.image) {
+          setResultImages((prev) => (prev.includes(data.image!) ? prev : [...prev, data.image!]));
+        } else if (data.status === 'completed') {
+          setResultImages(data.images || []);
+          setStep('result');
+        }
+      };
+
+      const acceptEvent = (data: GenerationStatus) => {
+        if (data.seq) {
+          if (data.seq <= lastSeq.current) return;
+          lastSeq.current = data.seq;
         }
+        applyStatus(data);
+      };
+
+      // Some proxies break WebSocket upgrades: follow the job over SSE instead
+      const connectEvents = () => {
+        if (stopped) return;
+        if (imageId.current === null) {
+          reconnectTimer = setTimeout(connectEvents, 1000);
+          return;
+        }
+        eventSource = new EventSource(generationApi.eventsUrl(imageId.current));
+        eventSource.addEventListener('status', (event) => {
+          const data = JSON.parse((event as MessageEvent).data);
+          acceptEvent(data);
+          if (data.status === 'completed' || data.status === 'failed') {
+            eventSource?.close();
+          }
+        });
+      };
+
+      const connect = () => {
+        let opened = false;
+        // After a drop, ask the server to replay what we missed (needs our token)
+        const params = new URLSearchParams({ access_token: localStorage.getItem('access_token') || '' });
+        if (lastSeq.current > 0) params.set('last_seq', String(lastSeq.current));
+        websocket = new WebSocket(`${wsUrl}/api/generation/ws/${user.id}?${params}`);
+        websocket.onopen = () => {
+          opened = true;
+          failedUpgrades = 0;
+        };
+        websocket.onmessage = (event) => {
+          const data = JSON.parse(event.data);
+          if (data.type === 'ping') {
+            // Server heartbeat: answer so the socket is not reaped as idle
+            websocket?.send(JSON.stringify({ type: 'pong' }));
+          } else if (data.type === 'snapshot') {
+            // Replay buffer no longer covers the gap: latest state per job
+            (data.jobs || []).forEach((job: GenerationStatus) => {
+              lastSeq.current = Math.max(lastSeq.current, job.seq || 0);
+              if (job.status === 'image_ready') {
+                setResultImages(job.images || []);
+                setStatus(job);
+              } else {
+                applyStatus(job);
+              }
+            });
+          } else if (data.status) {
+            acceptEvent(data);
+          }
+        };
+        websocket.onclose = () => {
+          if (stopped) return;
+          failedUpgrades = opened ? 0 : failedUpgrades + 1;
+          reconnectTimer = setTimeout(failedUpgrades >= 2 ? connectEvents : connect, 1000);
+        };
+      };
+
+      connect();
+      return () => {
+        stopped = true;
+        clearTimeout(reconnectTimer);
+        websocket?.close();
+        eventSource?.close();
       };
-      return () => websocket.close();
     }
   }, [step, user]);
 
@@ -57,24 +132,20 @@ const GeneratePage: React.FC = () => {
   const handleGenerate = async () => {
     if (!imageFile) return;
 
+    imageId.current = null;
     setStep('generating');
 
-    const reader = new FileReader();
-    reader.onloadend = async () => {
-      const base64 = (reader.result as string).split(',')[1];
-      try {
-        await generationApi.createGeneration({
-          image_base64: base64,
-          style_name: styleName || undefined,
-          aspect_ratio: aspectRatio,
-        });
-      } catch (error) {
-        console.error('Generation error:', error);
-        alert('Ошибка генерации');
-        setStep('style');
-      }
-    };
-    reader.readAsDataURL(imageFile);
+    try {
+      const generation = await generationApi.uploadGeneration(imageFile, {
+        style_name: styleName || undefined,
+        aspect_ratio: aspectRatio,
+      });
+      imageId.current = generation.id;
+    } catch (error) {
+      console.error('Generation error:', error);
+      alert('Ошибка генерации');
+      setStep('style');
+    }
   };
 
   if (!isAuthenticated) return null;
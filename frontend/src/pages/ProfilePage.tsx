@@ -14,6 +14,8 @@ const ProfilePage: React.FC = () => {
   const navigate = useNavigate();
   const [images, setImages] = useState<ProcessedImage[]>([]);
   const [orders, setOrders] = useState<Order[]>([]);
+  const [imagesCursor, setImagesCursor] = useState<string | null>(null);
+  const [ordersCursor, setOrdersCursor] = useState<string | null>(null);
   const [tab, setTab] = useState<'images' | 'orders'>('images');
 
   useEffect(() => {
@@ -30,13 +32,37 @@ const ProfilePage: React.FC = () => {
         userApi.getMyImages(),
         paymentApi.getMyOrders(),
       ]);
-      setImages(imagesData);
-      setOrders(ordersData);
+      setImages(imagesData.items);
+      setImagesCursor(imagesData.next_cursor ?? null);
+      setOrders(ordersData.items);
+      setOrdersCursor(ordersData.next_cursor ?? null);
     } catch (error) {
       console.error('Failed to load profile data:', error);
     }
   };
 
+  const loadMoreImages = async () => {
+    if (!imagesCursor) return;
+    try {
+      const page = await userApi.getMyImages(imagesCursor);
+      setImages((prev) => [...prev, ...page.items]);
+      setImagesCursor(page.next_cursor ?? null);
+    } catch (error) {
+      console.error('Failed to load images:', error);
+    }
+  };
+
+  const loadMoreOrders = async () => {
+    if (!ordersCursor) return;
+    try {
+      const page = await paymentApi.getMyOrders(ordersCursor);
+      setOrders((prev) => [...prev, ...page.items]);
+      setOrdersCursor(page.next_cursor ?? null);
+    } catch (error) {
+      console.error('Failed to load orders:', error);
+    }
+  };
+
   const handleLogout = () => {
     dispatch(logout());
     navigate('/');
@@ -92,6 +118,9 @@ const ProfilePage: React.FC = () => {
               </div>
             ))
           )}
+          {imagesCursor && (
+            <button onClick={loadMoreImages} className="load-more-btn">Показать ещё</button>
+          )}
         </div>
       )}
 
@@ -103,7 +132,7 @@ const ProfilePage: React.FC = () => {
             orders.map((order) => (
               <div key={order.id} className="order-card">
                 <div className="order-info">
-                  <h3>Заказ #{order.id}</h3>
+                  <h3>Заказ #{order.id}{order.package_name ? ` · ${order.package_name}` : ''}</h3>
                   <p className="order-status">{order.status === 'paid' ? 'Оплачен' : 'В ожидании'}</p>
                 </div>
                 <div className="order-details">
@@ -113,6 +142,9 @@ const ProfilePage: React.FC = () => {
               </div>
             ))
           )}
+          {ordersCursor && (
+            <button onClick={loadMoreOrders} className="load-more-btn">Показать ещё</button>
+          )}
         </div>
       )}
     </div>
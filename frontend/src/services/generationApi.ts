@@ -1,5 +1,5 @@
 import api from './api';
-import type { ProcessedImage, StylePreset } from '../types';
+import type { GenerationStatus, ProcessedImage, StylePreset } from '../types';
 
 export const generationApi = {
   createGeneration: async (data: {
@@ -13,6 +13,39 @@ export const generationApi = {
     return response.data;
   },
 
+  uploadGeneration: async (
+    image: File,
+    data: {
+      style_name?: string;
+      custom_prompt?: string;
+      aspect_ratio?: string;
+    }
+  ): Promise<ProcessedImage> => {
+    const form = new FormData();
+    form.append('image', image);
+    Object.entries(data).forEach(([key, value]) => {
+      if (value !== undefined) form.append(key, value);
+    });
+    const response = await api.post<ProcessedImage>('/generation/upload', form, {
+      headers: { 'Content-Type': 'multipart/form-data' },
+    });
+    return response.data;
+  },
+
+  // Fallbacks for networks where WebSocket upgrades fail
+  eventsUrl: (imageId: number): string => {
+    const apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+    const token = localStorage.getItem('access_token') || '';
+    return `${apiUrl}/api/generation/${imageId}/events?access_token=${encodeURIComponent(token)}`;
+  },
+
+  getStatus: async (imageId: number, wait = 0, since?: number): Promise<GenerationStatus> => {
+    const response = await api.get<GenerationStatus>(`/generation/${imageId}/status`, {
+      params: { wait, since },
+    });
+    return response.data;
+  },
+
   createStylePreset: async (name: string, styleData: Record<string, any>): Promise<StylePreset> => {
     const response = await api.post<StylePreset>('/generation/style-presets', {
       name,
@@ -1,5 +1,5 @@
 import api from './api';
-import type { Order } from '../types';
+import type { Order, Page } from '../types';
 
 export const paymentApi = {
   createPayment: async (
@@ -13,8 +13,10 @@ export const paymentApi = {
     return response.data;
   },
 
-  getMyOrders: async (): Promise<Order[]> => {
-    const response = await api.get<Order[]>('/payments/orders/my');
+  getMyOrders: async (cursor?: string, limit = 50): Promise<Page<Order>> => {
+    const response = await api.get<Page<Order>>('/payments/orders/my', {
+      params: { limit, cursor },
+    });
     return response.data;
   },
 };
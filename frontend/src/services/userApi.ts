@@ -1,5 +1,5 @@
 import api from './api';
-import type { User, ProcessedImage, StylePreset } from '../types';
+import type { User, ProcessedImage, StylePreset, Page } from '../types';
 
 export const userApi = {
   getCurrentUser: async (): Promise<User> => {
@@ -7,9 +7,9 @@ export const userApi = {
     return response.data;
   },
 
-  getMyImages: async (limit = 50, offset = 0): Promise<ProcessedImage[]> => {
-    const response = await api.get<ProcessedImage[]>('/users/me/images', {
-      params: { limit, offset },
+  getMyImages: async (cursor?: string, limit = 50): Promise<Page<ProcessedImage>> => {
+    const response = await api.get<Page<ProcessedImage>>('/users/me/images', {
+      params: { limit, cursor },
     });
     return response.data;
   },
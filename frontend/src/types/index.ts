@@ -23,6 +23,7 @@ export interface Order {
   id: number;
   user_id: number;
   package_id: number;
+  package_name?: string;
   amount: number;
   status: string;
   created_at: string;
@@ -40,6 +41,11 @@ export interface ProcessedImage {
   processed_file_id?: string;
 }
 
+export interface Page<T> {
+  items: T[];
+  next_cursor?: string | null;
+}
+
 export interface StylePreset {
   id: number;
   user_id: number;
@@ -56,11 +62,16 @@ export interface AuthResponse {
 }
 
 export interface GenerationStatus {
-  status: 'uploading' | 'analyzing' | 'generating_prompt' | 'generating_images' | 'completed' | 'failed';
+  status: 'pending' | 'queued' | 'uploading' | 'analyzing' | 'generating_prompt' | 'generating_images' | 'image_ready' | 'completed' | 'failed';
   progress: number;
   message: string;
+  image?: string;
+  index?: number;
+  position?: number;
+  eta_seconds?: number;
   images?: string[];
   image_id?: number;
+  seq?: number;
 }
 
 export const AuthMethod = {
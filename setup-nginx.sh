@@ -32,9 +32,15 @@ fi
 BACKEND_PORT=$(grep "^BACKEND_PORT=" .env 2>/dev/null | cut -d'=' -f2 || echo "8000")
 BOT_DIR=$(pwd)
 
+# nginx must accept the backend's upload limit (MAX_UPLOAD_SIZE_MB) plus multipart
+# overhead, or it answers with its own HTML 413 before the API's JSON error
+MAX_UPLOAD_SIZE_MB=$(grep "^MAX_UPLOAD_SIZE_MB=" .env 2>/dev/null | cut -d'=' -f2)
+CLIENT_MAX_BODY_MB=$(( ${MAX_UPLOAD_SIZE_MB:-15} + 1 ))
+
 echo -e "${GREEN}Using configuration:${NC}"
 echo "  Backend: 127.0.0.1:$BACKEND_PORT"
 echo "  Frontend static files: $BOT_DIR/static/"
+echo "  Max request body: ${CLIENT_MAX_BODY_MB}M"
 echo ""
 
 # Create nginx configuration
@@ -61,8 +67,8 @@ server {
     add_header X-XSS-Protection "1; mode=block" always;
     add_header Referrer-Policy "no-referrer-when-downgrade" always;
 
-    # Max upload size for image generation
-    client_max_body_size 10M;
+    # Max upload size for image generation (MAX_UPLOAD_SIZE_MB + 1)
+    client_max_body_size ${CLIENT_MAX_BODY_MB}M;
 
     # Gzip compression for static files
     gzip on;
@@ -109,6 +115,14 @@ server {
         access_log off;
     }
 
+    # Stored images - backend answers /api/images/<key> with X-Accel-Redirect
+    location /protected-images/ {
+        internal;
+        alias $BOT_DIR/data/images/;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+        access_log off;
+    }
+
     # WebSocket for real-time updates
     location /api/generation/ws {
         proxy_pass http://backend;